@@ -5,11 +5,19 @@ from abc import abstractmethod
 
 from textual.app import App, ComposeResult
 from textual import on
+from textual.css.query import QueryType
 from textual_countdown import Countdown
 
-from constants import SECONDS_BETWEEN_DISPATCHES, SERVER_IP, SERVER_PORT, SECONDS_BETWEEN_CONNECTION_CHECKS
+from attachments import AttachmentTransfer
+from compression import PayloadCompressor, load_dictionary
+from constants import SECONDS_BETWEEN_DISPATCHES, SERVER_IP, SERVER_PORT, SECONDS_BETWEEN_CONNECTION_CHECKS, \
+    RECORD_SESSIONS
 from data_structures import TextMessage, Dispatch
-from user_interface import TimeDisplay, DispatchDisplay, TextMessageInput, MainDisplay
+from history_sync import SyncHistory, HistorySynchronizer
+from outbound_queue import OutboundScheduler
+from session_recorder import SessionRecorder, stored_text
+from protocol import send_frame, receive_frame, exchange_hello, send_object, receive_object
+from user_interface import TimeDisplay, DispatchDisplay, TextMessageInput, MainDisplay, SearchBar
 
 def is_socket_closed(sock: socket.socket) -> bool:
     try:
@@ -27,47 +35,107 @@ def is_socket_closed(sock: socket.socket) -> bool:
 
 class BaseApp(App):
     CSS_PATH = "stylesheet.tcss"
-    BINDINGS = [("w,W", "write_message", "Write message"), ("ctrl+c", "do_nothing")]
+    BINDINGS = [("w,W", "write_message", "Write message"), ("ctrl+f", "search", "Search"), ("ctrl+c", "do_nothing")]
     ENABLE_COMMAND_PALETTE = False
 
     TITLE = "System for communication with the Earth"
 
+    outgoing_direction: int
+    session_log: str
+
 
     def __init__(self):
         self.connection_check_timer = None
         self.host = SERVER_IP
         self.port = SERVER_PORT
         self.logger = logging.getLogger()
+        self.set_up_exchange()
 
         super().__init__()
+
+    def set_up_exchange(self) -> None:
+        self.compressor = PayloadCompressor(load_dictionary())
+        self.outbound_scheduler = OutboundScheduler()
+        self.attachment_transfer = AttachmentTransfer()
+        self.session_recorder = SessionRecorder(self.session_log, type(self).__name__) if RECORD_SESSIONS else None
     
     
     def on_mount(self):
         self.connection_check_timer = self.set_interval(SECONDS_BETWEEN_CONNECTION_CHECKS, self.check_connection)
 
+    def on_unmount(self) -> None:
+        if self.session_recorder is not None:
+            self.session_recorder.close()
+
+    def query_screen_child(self, widget_type: type[QueryType]) -> QueryType:
+        # the widgets of the app are children of the screen, a query of the whole tree would walk the history
+        return self.screen.query_children(widget_type).first()
+
     def can_be_message_added_to_dispatch(self, text_message: TextMessage) -> bool:
-        if self.query_one(MainDisplay).get_last_dispatch_display().dispatch.is_full:
-            self.notify(title="Full dispatch", message="The dispatch is full. Wait for the next dispatch.",
-                        severity="error", timeout=5.0)
+        if self.query_screen_child(MainDisplay).get_last_dispatch_display().dispatch.is_full:
             self.logger.warning(f"User tried to add message to dispatch but reached dispatch limit.\n"
                              f"Message: {text_message}")
             return False
         return True
 
+    def queue_text_message(self, text_message: TextMessage, priority: int) -> None:
+        self.outbound_scheduler.enqueue(text_message, priority)
+        self.notify(title="Message queued",
+                    message=f"The message will be sent in one of the following dispatches. "
+                            f"Messages waiting: {len(self.outbound_scheduler)}",
+                    severity="warning", timeout=5.0)
+        self.logger.info(f"Message was added to the outbound queue with priority {priority}.\n"
+                         f"Message: {text_message}")
+
+    def handle_text_message_encryption(self, text_message: TextMessage) -> None:
+        pass
+
+    def backup(self) -> None:
+        # the history goes to the disk first, the queue without the messages taken from it only after that
+        self.query_screen_child(MainDisplay).backup()
+        self.outbound_scheduler.save()
+
+    def fill_dispatch_display_from_queue(self, dispatch_display: DispatchDisplay) -> None:
+        while (text_message := self.outbound_scheduler.pop_next(dispatch_display.dispatch)) is not None:
+            self.handle_text_message_encryption(text_message)
+            dispatch_display.add_new_text_message(text_message)
+            self.logger.info(f"Queued message was added to dispatch.\n"
+                             f"Message: {text_message}")
+
     @abstractmethod
     def create_text_message(self, text_message: TextMessageInput.TextMessageSubmitted) -> TextMessage:
         pass
 
+    def record(self, event_type: str, **fields) -> None:
+        if self.session_recorder is not None:
+            self.session_recorder.record(event_type, **fields)
+
     @on(TextMessageInput.TextMessageSubmitted)
     def add_text_message_to_dispatch_display(self, text_message: TextMessageInput.TextMessageSubmitted) -> None:
         new_text_message = self.create_text_message(text_message)
+        text, is_encrypted = stored_text(new_text_message)
+        self.record("message_submitted", sender=new_text_message.sender.user_id,
+                    recipient=new_text_message.recipient.user_id, subject=new_text_message.subject,
+                    text=text, is_encrypted=is_encrypted, priority=text_message.priority)
+        self.submit_text_message(new_text_message, text_message.priority, text_message.attachment_path)
+        self.screen.query_children(".text_message_input").first().remove()
 
-        if self.can_be_message_added_to_dispatch(new_text_message):
-            self.query_one(MainDisplay).get_last_dispatch_display().add_new_text_message(new_text_message)
+    def submit_text_message(self, text_message: TextMessage, priority: int, attachment_path: str | None = None) -> None:
+        if attachment_path is not None:
+            try:
+                text_message.attachment = self.attachment_transfer.attach(attachment_path)
+            except (OSError, ValueError) as error:
+                self.notify(title="Invalid attachment", message=f"The message was not sent, the file cannot be attached: {error}",
+                            severity="error", timeout=10.0)
+                self.logger.error(f"File {attachment_path} couldn't be attached because of the following error: {error}")
+                return
+        if self.can_be_message_added_to_dispatch(text_message):
+            self.query_screen_child(MainDisplay).get_last_dispatch_display().add_new_text_message(text_message)
             self.notify(title="Message added", message="Message was successfully added to the dispatch", severity="information", timeout=5.0)
             self.logger.info(f"Message was successfully added to dispatch.\n"
-                             f"Message: {new_text_message}")
-        self.query(".text_message_input").first().remove()
+                             f"Message: {text_message}")
+        else:
+            self.queue_text_message(text_message, priority)
 
     def check_connection(self):
         if is_socket_closed(self.peer):
@@ -75,9 +143,46 @@ class BaseApp(App):
             self.notify(title="Connection lost", message="Connection was lost. Inform administrator about the problem.", severity="error", timeout=10.0 )
    
 
+    def exchange_hello(self) -> None:
+        exchange_hello(self.peer, self.compressor)
+
+    def send_object(self, obj) -> None:
+        send_object(self.peer, self.compressor, obj)
+
+    def receive_object(self):
+        return receive_object(self.peer, self.compressor)
+
+    @abstractmethod
+    def synchronize_history(self, synchronizer: HistorySynchronizer) -> list[tuple[Dispatch, bool]]:
+        pass
+
+    def reconcile_history(self) -> None:
+        main_display = self.query_screen_child(MainDisplay)
+        history = SyncHistory(main_display.get_history(), self.outgoing_direction)
+        try:
+            received_dispatches = self.synchronize_history(
+                HistorySynchronizer(history, self.send_object, self.receive_object))
+        except BaseException as error:
+            self.notify(title="Synchronization error",
+                        message="The history cannot be synchronized due to connection error. Inform administrator about the problem",
+                        severity="error", timeout=30.0)
+            self.logger.error(f"History couldn't be synchronized because of the following error: {error}")
+            return
+
+        for received_dispatch, _ in received_dispatches:
+            self.handle_encryption(received_dispatch)
+        main_display.merge_history(received_dispatches)
+        self.logger.info(f"History was synchronized, {len(received_dispatches)} dispatches were received")
+        if received_dispatches:
+            self.notify(title="History synchronized",
+                        message=f"{len(received_dispatches)} missing dispatches were restored.",
+                        severity="information", timeout=5.0)
+
     def send_dispatch(self, dispatch_to_send: Dispatch) -> None:
         try:
-            self.peer.sendall(pickle.dumps(dispatch_to_send))
+            data = self.attachment_transfer.pack(dispatch_to_send)
+            payload = self.compressor.compress(data)
+            send_frame(self.peer, payload)
         except BaseException as error:
             self.notify(title="Connection error",
                         message="The dispatch cannot be sent due to connection error. Inform administrator about the problem",
@@ -85,20 +190,23 @@ class BaseApp(App):
             self.logger.error(f"Dispatch couldn't be sent because of the following error: {error}")
             return
         self.notify(message="The dispatch has been successfully sent.", severity="information", timeout=5.0)
+        if self.session_recorder is not None:
+            self.session_recorder.record_dispatch("dispatch_sent", dispatch_to_send)
         self.logger.info("Dispatch has been successfully sent.\n"
+                         f"Payload: {len(data)} bytes, {len(payload)} bytes on the wire (codec {payload[0]})\n"
                          f"Dispatch: {dispatch_to_send}")
 
 
     def show_received_dispatch(self, received_dispatch):
         received_dispatch_display = self.create_dispatch_display(received_dispatch, received=True)
-        self.query_one(MainDisplay).add_dispatch_display(received_dispatch_display)
+        self.query_screen_child(MainDisplay).add_dispatch_display(received_dispatch_display)
         self.notify(title="New dispatch", message="You have received a new dispatch.", severity="information", timeout=5.0)
 
     def handle_encryption(self, received_dispatch: Dispatch) -> None:
         pass
 
     def receive_dispatch(self) -> Dispatch | None:
-        received_data = self.peer.recv(16384)
+        received_data = receive_frame(self.peer)
         if not received_data:
             self.notify(title="Connection error",
                         message="The dispatch cannot be received due to connection error. Inform administrator about the problem",
@@ -106,7 +214,10 @@ class BaseApp(App):
             self.logger.error(f"Dispatch was not received. Received no data")
             return
 
-        received_dispatch = pickle.loads(received_data)
+        received_dispatch = pickle.loads(self.compressor.decompress(received_data))
+        self.receive_attachments(received_dispatch)
+        if self.session_recorder is not None:
+            self.session_recorder.record_dispatch("dispatch_received", received_dispatch)
         self.logger.info(f"New dispatch was received.\n"
                          f"Dispatch: {received_dispatch}")
         self.action_bell()
@@ -117,28 +228,60 @@ class BaseApp(App):
 
         return received_dispatch
 
+    def receive_attachments(self, received_dispatch: Dispatch) -> None:
+        completed_paths = self.attachment_transfer.unpack(received_dispatch)
+        if completed_paths is None:
+            self.notify(title="Attachment error",
+                        message="Received attachments cannot be stored. Inform administrator about the problem",
+                        severity="error", timeout=30.0)
+            return
+        for path in completed_paths:
+            self.notify(title="Attachment received", message=f"The attachment was stored in {path}",
+                        severity="information", timeout=10.0)
+
     def create_dispatch_display(self, dispatch: Dispatch, received: bool) -> DispatchDisplay:
         return DispatchDisplay(dispatch, received=received)
 
 
     @on(TimeDisplay.TimeToSendDispatch)
     def handle_incoming_and_outgoing_dispatch(self) -> None:
-        dispatch_to_send = self.query_one(MainDisplay).get_last_dispatch_display().dispatch
+        self.fill_dispatch_display_from_queue(self.query_screen_child(MainDisplay).get_last_dispatch_display())
+        dispatch_to_send = self.query_screen_child(MainDisplay).get_last_dispatch_display().dispatch
+        dispatch_to_send.sequence_number = self.query_screen_child(MainDisplay).next_sequence_number()
         self.send_dispatch(dispatch_to_send)
 
         self.receive_dispatch()
 
         new_dispatch_display = self.create_dispatch_display(Dispatch(), received=False)
-        self.query_one(MainDisplay).add_dispatch_display(new_dispatch_display)
+        self.query_screen_child(MainDisplay).add_dispatch_display(new_dispatch_display)
+        self.fill_dispatch_display_from_queue(new_dispatch_display)
+        self.backup()
 
-        self.query_one(Countdown).cancel()
-        self.query_one(Countdown).start(SECONDS_BETWEEN_DISPATCHES)
+        self.query_screen_child(Countdown).cancel()
+        self.query_screen_child(Countdown).start(SECONDS_BETWEEN_DISPATCHES)
 
     def action_write_message(self) -> None:
         message_input_widget = TextMessageInput(classes="text_message_input")
         self.mount(message_input_widget)
         message_input_widget.scroll_visible()
 
+    def action_search(self) -> None:
+        if self.screen.query_children(SearchBar):
+            self.query_one("#search_query").focus()
+            return
+        self.mount(SearchBar(classes="search_bar"))
+
+    @on(SearchBar.ResultRequested)
+    def show_search_result(self, request: SearchBar.ResultRequested) -> None:
+        results = self.query_screen_child(MainDisplay).search(request.query)
+        search_bar = self.query_screen_child(SearchBar)
+        if not results:
+            search_bar.show_result_status(0, 0)
+            return
+        result_index = request.result_index % len(results)
+        self.query_screen_child(MainDisplay).show_search_result(*results[result_index])
+        search_bar.show_result_status(result_index, len(results))
+
     @abstractmethod
     def compose(self) -> ComposeResult:
         pass
@@ -0,0 +1,216 @@
+import hashlib
+import logging
+import mmap
+import os
+import pickle
+
+from constants import ATTACHMENT_DIRECTORY, ATTACHMENTS_STATE_FILE, ATTACHMENT_CHUNK_SIZE, \
+    ATTACHMENT_CHUNKS_PER_FREE_SLOT
+from data_structures import Attachment, AttachmentChunk, Dispatch
+
+
+def to_ranges(indexes: set[int]) -> list[tuple[int, int]]:
+    ranges = []
+    for index in sorted(indexes):
+        if ranges and ranges[-1][1] == index:
+            ranges[-1] = (ranges[-1][0], index + 1)
+        else:
+            ranges.append((index, index + 1))
+    return ranges
+
+
+def from_ranges(ranges: list[tuple[int, int]]) -> set[int]:
+    return {index for start, end in ranges for index in range(start, end)}
+
+
+def file_sha256(path: str) -> str:
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        return hashlib.sha256(mapped).hexdigest()
+
+
+def read_chunks(attachment: Attachment, path: str, indexes: list[int]) -> list[AttachmentChunk]:
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        if len(mapped) != attachment.size:
+            raise ValueError(f"{path} changed since it was attached")
+        return [AttachmentChunk(attachment, index,
+                                mapped[index * attachment.chunk_size:(index + 1) * attachment.chunk_size])
+                for index in indexes]
+
+
+class AttachmentTransfer:
+    """Attachments on their way to the peer and from it.
+
+    Chunks of the attached files are read through mmap and take the message slots the dispatch left free.
+    Every dispatch acknowledges all chunks received so far, chunks the dispatch of the following window
+    does not acknowledge are sent again. Received chunks are written straight to a .part file and the
+    state is kept on disk, so after a disconnect or a restart only the missing chunks are sent.
+    """
+
+    def __init__(self, directory: str = ATTACHMENT_DIRECTORY, state_file: str = ATTACHMENTS_STATE_FILE) -> None:
+        self.directory = directory
+        self.state_file = state_file
+        self.logger = logging.getLogger()
+        # attachment id -> attachment, path of the file and chunks the peer acknowledged
+        self.outgoing: dict[str, tuple[Attachment, str, set[int]]] = {}
+        # attachment id -> attachment and chunks written to the .part file
+        self.incoming: dict[str, tuple[Attachment, set[int]]] = {}
+        self.completed: set[str] = set()
+        # completed attachments the peer sent a chunk of again, so it did not get the last acknowledgement
+        self.completed_to_acknowledge: dict[str, int] = {}
+        # (attachment id, chunk index) -> window the chunk was sent in
+        self.in_flight: dict[tuple[str, int], int] = {}
+        self.window = 0
+        self.restore()
+
+    def attach(self, path: str) -> Attachment:
+        if os.path.getsize(path) == 0:
+            raise ValueError("Empty files cannot be attached")
+        attachment = Attachment(os.path.basename(path), os.path.getsize(path), file_sha256(path),
+                                ATTACHMENT_CHUNK_SIZE)
+        self.outgoing.setdefault(attachment.attachment_id, (attachment, os.path.abspath(path), set()))
+        self.save()
+        self.logger.info(f"Attachment {attachment} will be sent in {attachment.chunk_count} chunks")
+        return attachment
+
+    def acknowledgements(self) -> tuple[tuple[str, list[tuple[int, int]]], ...]:
+        acknowledgements = [(attachment_id, to_ranges(received))
+                            for attachment_id, (_, received) in self.incoming.items()]
+        acknowledgements += [(attachment_id, [(0, chunk_count)])
+                             for attachment_id, chunk_count in self.completed_to_acknowledge.items()]
+        self.completed_to_acknowledge.clear()
+        return tuple(acknowledgements)
+
+    def fill_dispatch(self, dispatch: Dispatch) -> None:
+        self.window += 1
+        capacity = (dispatch.max_text_messages - len(dispatch.text_messages)) * ATTACHMENT_CHUNKS_PER_FREE_SLOT
+        chunks = []
+        for attachment_id, (attachment, path, acknowledged) in list(self.outgoing.items()):
+            if len(chunks) == capacity:
+                break
+            indexes = []
+            for index in range(attachment.chunk_count):
+                if len(chunks) + len(indexes) == capacity:
+                    break
+                if index not in acknowledged and (attachment_id, index) not in self.in_flight:
+                    indexes.append(index)
+            if not indexes:
+                continue
+            try:
+                chunks += read_chunks(attachment, path, indexes)
+            except (OSError, ValueError) as error:
+                self.logger.error(f"Attachment {attachment} cannot be sent because of the following error: {error}")
+                del self.outgoing[attachment_id]
+                continue
+            for index in indexes:
+                self.in_flight[(attachment_id, index)] = self.window
+
+        dispatch.attachment_chunks = tuple(chunks)
+        dispatch.attachment_acknowledgements = self.acknowledgements()
+
+    def part_path(self, attachment: Attachment) -> str:
+        return os.path.join(self.directory, f"{attachment.attachment_id}.part")
+
+    def completed_path(self, attachment: Attachment) -> str:
+        name, extension = os.path.splitext(os.path.basename(attachment.name) or "attachment")
+        path = os.path.join(self.directory, name + extension)
+        copy = 1
+        while os.path.exists(path):
+            path = os.path.join(self.directory, f"{name} ({copy}){extension}")
+            copy += 1
+        return path
+
+    def complete(self, attachment: Attachment) -> str | None:
+        part_path = self.part_path(attachment)
+        if file_sha256(part_path) != attachment.sha256:
+            # acknowledgements say what the receiver has, so the peer sends the whole file again
+            self.logger.error(f"Attachment {attachment} does not match its checksum, it will be received again")
+            self.incoming[attachment.attachment_id][1].clear()
+            return None
+        del self.incoming[attachment.attachment_id]
+        self.completed.add(attachment.attachment_id)
+        self.completed_to_acknowledge[attachment.attachment_id] = attachment.chunk_count
+        path = self.completed_path(attachment)
+        os.replace(part_path, path)
+        self.logger.info(f"Attachment {attachment} was received and stored in {path}")
+        return path
+
+    def receive_chunk(self, chunk: AttachmentChunk) -> str | None:
+        attachment = chunk.attachment
+        if attachment.attachment_id in self.completed:
+            self.completed_to_acknowledge[attachment.attachment_id] = attachment.chunk_count
+            return None
+        if not chunk.is_valid:
+            self.logger.warning(f"Chunk {chunk.index} of attachment {attachment} is damaged, it will be received again")
+            return None
+
+        if attachment.attachment_id not in self.incoming:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.part_path(attachment), "wb") as part:
+                part.truncate(attachment.size)
+            self.incoming[attachment.attachment_id] = (attachment, set())
+        _, received = self.incoming[attachment.attachment_id]
+        with open(self.part_path(attachment), "r+b") as part:
+            part.seek(chunk.index * attachment.chunk_size)
+            part.write(chunk.data)
+        received.add(chunk.index)
+        if len(received) == attachment.chunk_count:
+            return self.complete(attachment)
+        return None
+
+    def acknowledge(self, attachment_id: str, received: set[int]) -> None:
+        if attachment_id not in self.outgoing:
+            return
+        attachment, _, acknowledged = self.outgoing[attachment_id]
+        if len(received) < attachment.chunk_count:
+            acknowledged.clear()
+            acknowledged.update(received)
+            return
+        del self.outgoing[attachment_id]
+        for index in range(attachment.chunk_count):
+            self.in_flight.pop((attachment_id, index), None)
+        self.logger.info(f"Attachment {attachment} was delivered")
+
+    def handle_dispatch(self, dispatch: Dispatch) -> list[str]:
+        """Store the received chunks and return paths of the attachments they completed"""
+        completed_paths = []
+        for chunk in dispatch.attachment_chunks:
+            path = self.receive_chunk(chunk)
+            if path is not None:
+                completed_paths.append(path)
+        for attachment_id, ranges in dispatch.attachment_acknowledgements:
+            self.acknowledge(attachment_id, from_ranges(ranges))
+        # the peer composed its dispatch before it got the chunks of this window, older ones are lost if missing
+        self.in_flight = {key: window for key, window in self.in_flight.items() if window >= self.window}
+        self.save()
+        return completed_paths
+
+    def pack(self, dispatch: Dispatch) -> bytes:
+        """Pickled dispatch with the chunks and acknowledgements of this window"""
+        self.fill_dispatch(dispatch)
+        try:
+            return pickle.dumps(dispatch)
+        finally:
+            # the history keeps only the messages, the chunks are not needed once they are on their way
+            dispatch.attachment_chunks = ()
+            dispatch.attachment_acknowledgements = ()
+
+    def unpack(self, dispatch: Dispatch) -> list[str] | None:
+        """Take the attachments out of a received dispatch, None when they cannot be stored"""
+        try:
+            return self.handle_dispatch(dispatch)
+        except OSError as error:
+            self.logger.error(f"Attachments couldn't be stored because of the following error: {error}")
+            return None
+        finally:
+            dispatch.attachment_chunks = ()
+            dispatch.attachment_acknowledgements = ()
+
+    def save(self) -> None:
+        with open(self.state_file, "wb") as state_file:
+            pickle.dump((self.outgoing, self.incoming, self.completed), state_file)
+
+    def restore(self) -> None:
+        if not os.path.exists(self.state_file) or os.stat(self.state_file).st_size == 0:
+            return
+        with open(self.state_file, "rb") as state_file:
+            self.outgoing, self.incoming, self.completed = pickle.load(state_file)
@@ -0,0 +1,42 @@
+import argparse
+import sys
+
+from benchmarks.suite import HISTORY_SIZES, run_suite, compare, load_results, save_results
+
+DEFAULT_BASELINE = "benchmarks/baselines/baseline.json"
+DEFAULT_THRESHOLD = 0.25
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                     description="Benchmarks of the data structures and the exchange path")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmarks and store the results as JSON")
+    run_parser.add_argument("--sizes", type=int, nargs="+", default=HISTORY_SIZES, help="history sizes in windows")
+    run_parser.add_argument("--only", nargs="+", help="run only benchmarks whose names start with these prefixes")
+    run_parser.add_argument("--output", default="bench_output.json")
+
+    compare_parser = commands.add_parser("compare", help="compare results with a baseline and flag regressions")
+    compare_parser.add_argument("current", nargs="?", default="bench_output.json")
+    compare_parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    compare_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                                help="allowed relative slowdown of the fastest sample, 0.25 means 25 %%")
+
+    arguments = parser.parse_args()
+    if arguments.command == "run":
+        results = run_suite(arguments.sizes, arguments.only)
+        save_results(results, arguments.output)
+        print(f"Results were saved to {arguments.output}")
+        return 0
+
+    regressions = compare(load_results(arguments.baseline), load_results(arguments.current), arguments.threshold)
+    if regressions:
+        print(f"{len(regressions)} benchmarks regressed by more than {arguments.threshold:.0%}")
+        return 1
+    print("No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
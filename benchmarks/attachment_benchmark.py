@@ -0,0 +1,102 @@
+import argparse
+import os
+import pickle
+import socket
+import tempfile
+import threading
+import time
+
+from attachments import AttachmentTransfer, file_sha256
+from benchmarks.workloads import CountingChannel
+from compression import PayloadCompressor, load_dictionary
+from constants import SECONDS_BETWEEN_DISPATCHES
+from data_structures import Dispatch
+from protocol import send_frame
+
+
+class ThrottledChannel(CountingChannel):
+    """Channel that takes as long to send a frame as a link of the given bandwidth would"""
+
+    def __init__(self, sock: socket.socket, compressor: PayloadCompressor, bandwidth: float) -> None:
+        super().__init__(sock, compressor)
+        self.bandwidth = bandwidth
+
+    def send(self, message) -> None:
+        payload = self.compressor.compress(pickle.dumps(message))
+        time.sleep((len(payload) + 4) / self.bandwidth)
+        self.bytes_sent += len(payload) + 4
+        self.frames_sent += 1
+        send_frame(self.sock, payload)
+
+
+def exchange(sending: ThrottledChannel, receiving: ThrottledChannel, dispatch: Dispatch) -> Dispatch:
+    # both sides of a window send at once, the receiver has to read while the frame is being sent
+    sender = threading.Thread(target=sending.send, args=(dispatch,))
+    sender.start()
+    received = receiving.receive()
+    sender.join()
+    return received
+
+
+def run(size: int, bandwidth: float, lose_every: int, restart_at: int, path: str | None) -> None:
+    dictionary = load_dictionary()
+    with tempfile.TemporaryDirectory() as directory:
+        if path is None:
+            path = os.path.join(directory, "attachment.bin")
+            with open(path, "wb") as attachment_file:
+                attachment_file.write(os.urandom(size))
+        sender = AttachmentTransfer(os.path.join(directory, "sent"), os.path.join(directory, "sender.pkl"))
+        receiver_state = os.path.join(directory, "receiver.pkl")
+        receiver = AttachmentTransfer(os.path.join(directory, "received"), receiver_state)
+
+        outpost_socket, earth_socket = socket.socketpair()
+        outpost = ThrottledChannel(outpost_socket, PayloadCompressor(dictionary), bandwidth)
+        earth = ThrottledChannel(earth_socket, PayloadCompressor(dictionary), bandwidth)
+
+        attachment = sender.attach(path)
+        chunks_sent = 0
+        lost_windows = 0
+        windows = 0
+        completed_paths = []
+        start = time.perf_counter()
+        while sender.outgoing:
+            windows += 1
+            if windows == restart_at:
+                # the receiver goes down between windows and continues from its state file
+                receiver = AttachmentTransfer(os.path.join(directory, "received"), receiver_state)
+
+            outpost_dispatch, earth_dispatch = Dispatch(), Dispatch()
+            sender.fill_dispatch(outpost_dispatch)
+            receiver.fill_dispatch(earth_dispatch)
+            chunks_sent += len(outpost_dispatch.attachment_chunks)
+
+            received_by_earth = exchange(outpost, earth, outpost_dispatch)
+            if lose_every and windows % lose_every == 0:
+                lost_windows += 1
+            else:
+                completed_paths += receiver.handle_dispatch(received_by_earth)
+            sender.handle_dispatch(exchange(earth, outpost, earth_dispatch))
+        elapsed = time.perf_counter() - start
+
+        intact = bool(completed_paths) and file_sha256(completed_paths[0]) == attachment.sha256
+        bytes_sent = outpost.bytes_sent + earth.bytes_sent
+        print(f"Attachment: {attachment.size} bytes in {attachment.chunk_count} chunks of {attachment.chunk_size} bytes")
+        print(f"Link: {bandwidth / 1e6:.2f} MB/s each way, {lost_windows} of {windows} outgoing dispatches lost"
+              + (f", receiver restarted before window {restart_at}" if restart_at else ""))
+        print(f"Windows: {windows}, with real windows {windows * SECONDS_BETWEEN_DISPATCHES / 3600:.1f} h")
+        print(f"Chunks sent: {chunks_sent} ({chunks_sent - attachment.chunk_count} sent again)")
+        print(f"On the wire: {bytes_sent} bytes, {bytes_sent / attachment.size:.1%} of the attachment size")
+        print(f"Elapsed: {elapsed:.2f} s, throughput {attachment.size / elapsed / 1e6:.2f} MB/s "
+              f"({attachment.size / elapsed / bandwidth:.0%} of the link)")
+        print(f"Reassembled file matches: {intact}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Transfer of an attachment over a bandwidth limited local link")
+    parser.add_argument("--size", type=int, default=8 * 1024 * 1024, help="size of a random attachment in bytes")
+    parser.add_argument("--file", help="send this file instead of random data, e.g. morse.mp3")
+    parser.add_argument("--bandwidth", type=float, default=4e6, help="bytes per second in each direction")
+    parser.add_argument("--lose-every", type=int, default=0, help="lose every n-th outgoing dispatch")
+    parser.add_argument("--restart-at", type=int, default=0, help="restart the receiver before this window")
+    arguments = parser.parse_args()
+    run(arguments.size, arguments.bandwidth, arguments.lose_every, arguments.restart_at, arguments.file)
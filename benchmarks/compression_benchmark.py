@@ -0,0 +1,79 @@
+import argparse
+import pickle
+import random
+import time
+
+from compression import PayloadCompressor, train_dictionary, CODEC_NONE, CODEC_ZLIB, CODEC_ZLIB_DICTIONARY, \
+    CODEC_LZMA
+from constants import COMPRESSION_CORPUS_FILE, MAX_MESSAGES_IN_DISPATCH
+from data_structures import Dispatch, TextMessage
+from users import USERS
+
+CODEC_NAMES = {CODEC_NONE: "none", CODEC_ZLIB: "zlib", CODEC_ZLIB_DICTIONARY: "zlib+dictionary",
+               CODEC_LZMA: "lzma"}
+
+
+def load_corpus(corpus_file: str) -> list[Dispatch]:
+    with open(corpus_file, "rb") as corpus:
+        return [dispatch for dispatch, _ in pickle.load(corpus) if dispatch.text_messages]
+
+
+def generate_dispatches(text_messages: list[TextMessage], count: int, rng: random.Random) -> list[Dispatch]:
+    users = list(USERS.values())[1:]
+    dispatches = []
+    for _ in range(count):
+        dispatch = Dispatch()
+        for _ in range(MAX_MESSAGES_IN_DISPATCH):
+            template = rng.choice(text_messages)
+            dispatch.add_new_text_messages(
+                TextMessage(rng.choice(users), rng.choice(users), template.subject, template.text,
+                            f"{rng.randrange(24):02}:{rng.randrange(60):02}:{rng.randrange(60):02}"))
+        dispatches.append(dispatch)
+    return dispatches
+
+
+def measure(compressor: PayloadCompressor, codec: int, payloads: list[bytes], repeats: int) -> tuple[float, float]:
+    compressed_size = sum(len(compressor.compress_with(codec, payload)) for payload in payloads)
+    start = time.process_time()
+    for _ in range(repeats):
+        for payload in payloads:
+            compressor.compress_with(codec, payload)
+    cpu_per_payload = (time.process_time() - start) / (repeats * len(payloads))
+    original_size = sum(len(payload) for payload in payloads)
+    return original_size / compressed_size, cpu_per_payload
+
+
+def run(corpus_file: str, batch_sizes: list[int], repeats: int, seed: int) -> None:
+    rng = random.Random(seed)
+    corpus = load_corpus(corpus_file)
+    # train on the older part of the corpus only, so the dictionary never saw the measured messages
+    split = len(corpus) * 3 // 4
+    dictionary = train_dictionary([pickle.dumps(dispatch) for dispatch in corpus[:split]])
+    held_out_messages = [text_message for dispatch in corpus[split:] for text_message in dispatch.text_messages]
+    compressor = PayloadCompressor(dictionary)
+
+    workloads = [("5-message dispatch", [pickle.dumps(dispatch)
+                                         for dispatch in generate_dispatches(held_out_messages, 100, rng)])]
+    for batch_size in batch_sizes:
+        batch = generate_dispatches(held_out_messages, batch_size, rng)
+        workloads.append((f"catch-up batch of {batch_size}", [pickle.dumps(batch)]))
+
+    print(f"Dictionary: {len(dictionary)} bytes trained from {split} dispatches of {corpus_file}")
+    print(f"{'workload':<28}{'codec':<18}{'raw bytes':>12}{'ratio':>9}{'CPU ms':>10}")
+    for name, payloads in workloads:
+        raw_size = sum(len(payload) for payload in payloads) // len(payloads)
+        for codec in (CODEC_ZLIB, CODEC_ZLIB_DICTIONARY, CODEC_LZMA):
+            ratio, cpu = measure(compressor, codec, payloads, repeats)
+            print(f"{name:<28}{CODEC_NAMES[codec]:<18}{raw_size:>12}{ratio:>9.2f}{cpu * 1000:>10.3f}")
+        chosen = [compressor.compress(payload)[0] for payload in payloads]
+        print(f"{name:<28}{'selected: ' + CODEC_NAMES[max(set(chosen), key=chosen.count)]:<18}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compression ratio and CPU cost of dispatch payloads")
+    parser.add_argument("--corpus", default=COMPRESSION_CORPUS_FILE)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+    run(arguments.corpus, arguments.batch_sizes, arguments.repeats, arguments.seed)
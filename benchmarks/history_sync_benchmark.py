@@ -0,0 +1,55 @@
+import argparse
+import pickle
+import random
+import socket
+import threading
+import time
+
+from benchmarks.workloads import CountingChannel, generate_history
+from compression import PayloadCompressor, load_dictionary
+from history_sync import SyncHistory, HistorySynchronizer, TO_EARTH, FROM_EARTH
+
+
+def run(windows: int, lost_windows: int, changed_windows: int, seed: int) -> None:
+    rng = random.Random(seed)
+    client_history = generate_history(windows, rng)
+    # the server sees the client's sent dispatches as received and the other way around
+    server_history = [(dispatch, not is_received) for dispatch, is_received in pickle.loads(pickle.dumps(client_history))]
+
+    lost = set(rng.sample(range(windows), lost_windows))
+    server_history = [entry for entry in server_history if entry[0].sequence_number not in lost]
+    for dispatch, _ in rng.sample(server_history, changed_windows):
+        dispatch.text_messages[0].text += " (changed)"
+
+    dictionary = load_dictionary()
+    client_socket, server_socket = socket.socketpair()
+    client_channel = CountingChannel(client_socket, PayloadCompressor(dictionary))
+    server_channel = CountingChannel(server_socket, PayloadCompressor(dictionary))
+    client = HistorySynchronizer(SyncHistory(client_history, TO_EARTH), client_channel.send, client_channel.receive)
+    server = HistorySynchronizer(SyncHistory(server_history, FROM_EARTH), server_channel.send, server_channel.receive)
+
+    results = {}
+    start = time.perf_counter()
+    server_thread = threading.Thread(target=lambda: results.update(server=server.respond()))
+    server_thread.start()
+    results["client"] = client.initiate()
+    server_thread.join()
+    elapsed = time.perf_counter() - start
+
+    print(f"History: {len(client_history)} dispatches on the client, {len(server_history)} on the server "
+          f"({lost_windows} windows lost, {changed_windows} dispatches changed)")
+    print(f"Client received {len(results['client'])} dispatches, server received {len(results['server'])}")
+    print(f"Client sent {client_channel.bytes_sent} bytes in {client_channel.frames_sent} frames")
+    print(f"Server sent {server_channel.bytes_sent} bytes in {server_channel.frames_sent} frames")
+    print(f"Full history pickle: {len(pickle.dumps(client_history))} bytes")
+    print(f"Elapsed: {elapsed:.3f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Traffic needed to reconcile diverged dispatch histories")
+    parser.add_argument("--windows", type=int, default=50000)
+    parser.add_argument("--lost-windows", type=int, default=3)
+    parser.add_argument("--changed-windows", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+    run(arguments.windows, arguments.lost_windows, arguments.changed_windows, arguments.seed)
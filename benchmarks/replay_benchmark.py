@@ -0,0 +1,64 @@
+import argparse
+import random
+
+from constants import SECONDS_BETWEEN_DISPATCHES
+from data_structures import TextMessage, User
+from replay_session import build_schedules, replay, summarize, print_report
+from session_recorder import stored_text
+from users import USERS
+
+WINDOWS_IN_WEEK = 7 * 24 * 3600 // SECONDS_BETWEEN_DISPATCHES
+
+
+def submitted(t: float, sender: User, recipient: User, subject: str, text: str, priority: int) -> dict:
+    # the log keeps the texts of encrypted accounts as they are stored
+    text, is_encrypted = stored_text(TextMessage(sender, recipient, subject, text, ""))
+    return {"t": t, "type": "message_submitted", "sender": sender.user_id, "recipient": recipient.user_id,
+            "subject": subject, "text": text, "is_encrypted": is_encrypted, "priority": priority}
+
+
+def generate_sessions(windows: int, rng: random.Random) -> tuple[list[dict], list[dict]]:
+    """Client and server events of a session where every window somebody at the outpost and the Earth write"""
+    outpost_users = [user for key, user in USERS.items() if key not in ("no_account", "earth")]
+    client_events = [{"t": 0.0, "type": "session_start", "role": "ClientApp"}]
+    server_events = [{"t": 0.0, "type": "session_start", "role": "ServerApp"}]
+    for window in range(windows):
+        start = window * SECONDS_BETWEEN_DISPATCHES
+        user = rng.choice(outpost_users)
+        client_events.append({"t": start + 10.0, "type": "login", "user_id": user.user_id})
+        for index in range(rng.randrange(1, user.text_message_limit + 2)):
+            client_events.append(submitted(start + 20.0 + index, user, USERS["earth"], f"Report {window}/{index}",
+                                           f"Status of the outpost {rng.getrandbits(48):x}", 0))
+        client_events.append({"t": start + 30.0, "type": "logout", "user_id": user.user_id})
+        for index in range(rng.randrange(0, 3)):
+            server_events.append(submitted(start + 40.0 + index, USERS["earth"], rng.choice(outpost_users),
+                                           f"Earth {window}/{index}", f"Answer {rng.getrandbits(48):x}",
+                                           rng.randrange(3)))
+        for events in (client_events, server_events):
+            for event_type in ("dispatch_sent", "dispatch_received"):
+                events.append({"t": float(start + SECONDS_BETWEEN_DISPATCHES), "type": event_type,
+                               "sequence_number": window, "messages": []})
+    return client_events, server_events
+
+
+def run(windows: int, speed: float, target: float, seed: int) -> None:
+    client_events, server_events = generate_sessions(windows, random.Random(seed))
+    client_inputs, server_inputs, window_times = build_schedules(client_events, server_events, None)
+    results = replay(client_inputs, server_inputs, window_times, speed)
+    summaries = [summarize(role, results[role]) for role in ("client", "server")]
+    print_report(summaries, results, per_window=False)
+
+    duration = max(summary["duration_s"] for summary in summaries)
+    print(f"Replayed {windows} windows ({windows * SECONDS_BETWEEN_DISPATCHES / 86400:.1f} days) in {duration:.1f} s, "
+          f"target {target:.0f} s: {'met' if duration <= target else 'missed'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay of a generated week of windows against headless apps")
+    parser.add_argument("--windows", type=int, default=WINDOWS_IN_WEEK)
+    parser.add_argument("--speed", type=float, default=0, help="how many times faster than real time, 0 as fast "
+                                                                "as possible")
+    parser.add_argument("--target", type=float, default=60.0, help="seconds the whole replay should fit in")
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+    run(arguments.windows, arguments.speed, arguments.target, arguments.seed)
@@ -0,0 +1,65 @@
+import argparse
+import pickle
+import random
+import statistics
+import time
+
+from constants import COMPRESSION_CORPUS_FILE
+from search_index import SearchIndex, tokenize
+
+
+def load_vocabulary(corpus_file: str) -> list[str]:
+    with open(corpus_file, "rb") as corpus:
+        dispatches = pickle.load(corpus)
+    words = set()
+    for dispatch, _ in dispatches:
+        for text_message in dispatch.text_messages:
+            words.update(f"{text_message.subject} {text_message.text}".split())
+    return sorted(words)
+
+
+def run(documents: int, queries: int, seed: int, corpus_file: str) -> None:
+    rng = random.Random(seed)
+    vocabulary = load_vocabulary(corpus_file)
+    index = SearchIndex()
+
+    start = time.perf_counter()
+    for document_id in range(documents):
+        words = rng.choices(vocabulary, k=rng.randrange(4, 16))
+        # a few words are specific to the document, like names, numbers and coordinates
+        words.append(f"{rng.choice('abcdefgh')}{rng.randrange(100000)}")
+        index.add(document_id, " ".join(words))
+    build_time = time.perf_counter() - start
+    print(f"Indexed {documents} documents with {len(index.postings)} terms in {build_time:.1f} s "
+          f"({build_time / documents * 1e6:.1f} us per document)")
+
+    folded_vocabulary = sorted({token for word in vocabulary for token in tokenize(word)})
+    workloads = {
+        "single word": lambda: rng.choice(folded_vocabulary),
+        "two words": lambda: " ".join(rng.choices(folded_vocabulary, k=2)),
+        "three words": lambda: " ".join(rng.choices(folded_vocabulary, k=3)),
+        "prefix": lambda: rng.choice(folded_vocabulary)[:3],
+        "word and prefix": lambda: f"{rng.choice(folded_vocabulary)} {rng.choice(folded_vocabulary)[:2]}",
+        "rare word": lambda: f"{rng.choice('abcdefgh')}{rng.randrange(100000)}",
+    }
+    print(f"{'query':<18}{'median ms':>12}{'p99 ms':>10}{'max ms':>10}")
+    for name, make_query in workloads.items():
+        latencies = []
+        for _ in range(queries):
+            query = make_query()
+            start = time.perf_counter()
+            index.search(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+        latencies.sort()
+        print(f"{name:<18}{statistics.median(latencies):>12.3f}{latencies[int(len(latencies) * 0.99)]:>10.3f}"
+              f"{latencies[-1]:>10.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency of message history search")
+    parser.add_argument("--documents", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--corpus", default=COMPRESSION_CORPUS_FILE)
+    arguments = parser.parse_args()
+    run(arguments.documents, arguments.queries, arguments.seed, arguments.corpus)
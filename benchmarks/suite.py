@@ -0,0 +1,279 @@
+import asyncio
+import json
+import os
+import pickle
+import platform
+import random
+import socket
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Callable
+
+from textual.app import App
+
+from benchmarks.workloads import CountingChannel, generate_history
+from compression import PayloadCompressor, load_dictionary
+from constants import BACKUP_FILE, COMPRESSION_CORPUS_FILE
+from data_structures import Dispatch, decode_card_id, KEY_MAPPINGS
+from history_sync import SyncHistory, HistorySynchronizer, TO_EARTH, FROM_EARTH
+from protocol import send_frame, receive_frame
+from user_interface import MainDisplay
+from users import USERS, get_user_by_id
+
+HISTORY_SIZES = [10, 100, 1000]
+REPEATS = 7
+MIN_SAMPLE_TIME = 0.05
+MAIN_DISPLAY_REPEATS = 3
+# mounting the widgets dominates and takes seconds already for a hundred windows
+MAIN_DISPLAY_MAX_SIZE = 100
+
+
+def sample(function: Callable[[], None], setup: Callable[[], None] | None, number: int) -> float:
+    elapsed = 0.0
+    for _ in range(number):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        elapsed += time.perf_counter() - start
+    return elapsed
+
+
+def measure(function: Callable[[], None], repeats: int = REPEATS, setup: Callable[[], None] | None = None) -> dict:
+    """Time of one call, every sample runs the function often enough to last at least MIN_SAMPLE_TIME"""
+    number = 1
+    while sample(function, setup, number) < MIN_SAMPLE_TIME:
+        number *= 2
+    times = [sample(function, setup, number) / number for _ in range(repeats)]
+    return {"median": statistics.median(times), "min": min(times), "max": max(times), "repeats": repeats,
+            "number": number}
+
+
+def history_dispatches(size: int) -> list[Dispatch]:
+    return [dispatch for dispatch, _ in generate_history(size, random.Random(size))]
+
+
+def benchmark_add_new_text_messages(size: int) -> dict:
+    text_messages = [text_message for dispatch in history_dispatches(size) for text_message in dispatch.text_messages]
+
+    def fill_dispatches():
+        dispatch = Dispatch()
+        for text_message in text_messages:
+            if not dispatch.add_new_text_messages(text_message):
+                dispatch = Dispatch(text_message)
+
+    return measure(fill_dispatches)
+
+
+def benchmark_count_messages_by_sender(size: int) -> dict:
+    dispatches = history_dispatches(size)
+    users = list(USERS.values())
+
+    def count_all():
+        for dispatch in dispatches:
+            for user in users:
+                dispatch.count_messages_by_sender(user)
+
+    return measure(count_all)
+
+
+def benchmark_encrypt_walker(size: int) -> dict:
+    dispatches = history_dispatches(size)
+
+    def decrypt_all():
+        for dispatch in dispatches:
+            dispatch.decrypt_all_messages()
+
+    def encrypt_all():
+        for dispatch in dispatches:
+            dispatch.encrypt_all_messages()
+
+    return measure(encrypt_all, setup=decrypt_all)
+
+
+def benchmark_decrypt_walker(size: int) -> dict:
+    dispatches = history_dispatches(size)
+    user = USERS["olga_kovalenko"]
+
+    def encrypt_all():
+        for dispatch in dispatches:
+            dispatch.encrypt_all_messages()
+
+    # the walk done on login of an encrypted account
+    def decrypt_all_of_user():
+        for dispatch in dispatches:
+            dispatch.decrypt_all_messages_of_user(user)
+
+    return measure(decrypt_all_of_user, setup=encrypt_all)
+
+
+def benchmark_decode_card_id(size: int) -> dict:
+    rng = random.Random(size)
+    card_ids = ["".join(rng.choices(list(KEY_MAPPINGS), k=10)) for _ in range(size)]
+    return measure(lambda: [decode_card_id(card_id) for card_id in card_ids])
+
+
+def benchmark_get_user_by_id(size: int) -> dict:
+    rng = random.Random(size)
+    user_ids = [rng.choice([user.user_id for user in USERS.values()] + [123]) for _ in range(size)]
+    return measure(lambda: [get_user_by_id(user_id) for user_id in user_ids])
+
+
+def benchmark_pickle_round_trip(size: int) -> dict:
+    dispatches = history_dispatches(size)
+    return measure(lambda: [pickle.loads(pickle.dumps(dispatch)) for dispatch in dispatches])
+
+
+async def measure_main_display(size: int, repeats: int = MAIN_DISPLAY_REPEATS) -> tuple[dict, dict]:
+    history = generate_history(size, random.Random(size))
+    app = App()
+    backup_times = []
+    restore_times = []
+    async with app.run_test() as pilot:
+        for _ in range(repeats):
+            with open(BACKUP_FILE, "wb") as backup:
+                pickle.dump(history, backup)
+
+            # MainDisplay restores the backup when it is mounted
+            main_display = MainDisplay()
+            start = time.perf_counter()
+            await app.mount(main_display)
+            await pilot.pause()
+            restore_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            main_display.backup()
+            backup_times.append(time.perf_counter() - start)
+            await main_display.remove()
+
+    return ({"median": statistics.median(backup_times), "min": min(backup_times), "max": max(backup_times),
+             "repeats": repeats},
+            {"median": statistics.median(restore_times), "min": min(restore_times), "max": max(restore_times),
+             "repeats": repeats})
+
+
+def benchmark_loopback_exchange(size: int) -> dict:
+    dispatches = history_dispatches(size)
+    dictionary = load_dictionary(COMPRESSION_CORPUS_FILE)
+    client_socket, server_socket = socket.socketpair()
+    client_compressor, server_compressor = PayloadCompressor(dictionary), PayloadCompressor(dictionary)
+
+    # every window both sides send their dispatch first and then receive the other one
+    def exchange_windows():
+        for sent_by_client, sent_by_server in zip(dispatches[::2], dispatches[1::2]):
+            send_frame(client_socket, client_compressor.compress(pickle.dumps(sent_by_client)))
+            send_frame(server_socket, server_compressor.compress(pickle.dumps(sent_by_server)))
+            pickle.loads(server_compressor.decompress(receive_frame(server_socket))).decrypt_all_messages()
+            pickle.loads(client_compressor.decompress(receive_frame(client_socket))).encrypt_all_messages()
+
+    result = measure(exchange_windows)
+    client_socket.close()
+    server_socket.close()
+    return result
+
+
+def benchmark_history_reconciliation(size: int) -> dict:
+    client_history = generate_history(size, random.Random(size))
+    server_history = [(dispatch, not is_received) for dispatch, is_received in pickle.loads(pickle.dumps(client_history))]
+
+    def reconcile():
+        client_socket, server_socket = socket.socketpair()
+        client_channel = CountingChannel(client_socket, PayloadCompressor())
+        server_channel = CountingChannel(server_socket, PayloadCompressor())
+        server = HistorySynchronizer(SyncHistory(server_history, FROM_EARTH), server_channel.send,
+                                     server_channel.receive)
+        server_thread = threading.Thread(target=server.respond)
+        server_thread.start()
+        HistorySynchronizer(SyncHistory(client_history, TO_EARTH), client_channel.send,
+                            client_channel.receive).initiate()
+        server_thread.join()
+        client_socket.close()
+        server_socket.close()
+
+    return measure(reconcile)
+
+
+BENCHMARKS = {
+    "dispatch.add_new_text_messages": benchmark_add_new_text_messages,
+    "dispatch.count_messages_by_sender": benchmark_count_messages_by_sender,
+    "dispatch.encrypt_all_messages": benchmark_encrypt_walker,
+    "dispatch.decrypt_all_messages_of_user": benchmark_decrypt_walker,
+    "decode_card_id": benchmark_decode_card_id,
+    "get_user_by_id": benchmark_get_user_by_id,
+    "dispatch.pickle_round_trip": benchmark_pickle_round_trip,
+    "exchange.loopback": benchmark_loopback_exchange,
+    "exchange.history_reconciliation": benchmark_history_reconciliation,
+}
+
+
+def run_suite(sizes: list[int], selected: list[str] | None = None) -> dict:
+    def is_selected(name: str) -> bool:
+        return not selected or any(name.startswith(prefix) for prefix in selected)
+
+    results = {}
+    for name, benchmark in BENCHMARKS.items():
+        if not is_selected(name):
+            continue
+        for size in sizes:
+            results[f"{name}[{size}]"] = benchmark(size)
+            print(f"{name}[{size}]: {results[f'{name}[{size}]']['median'] * 1000:.3f} ms", flush=True)
+
+    if is_selected("main_display.backup") or is_selected("main_display.restore_from_backup"):
+        # MainDisplay works with BACKUP_FILE in the current directory, so it gets a directory of its own
+        working_directory = os.getcwd()
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            try:
+                for size in [size for size in sizes if size <= MAIN_DISPLAY_MAX_SIZE]:
+                    backup, restore = asyncio.run(measure_main_display(size))
+                    for name, result in (("main_display.backup", backup),
+                                         ("main_display.restore_from_backup", restore)):
+                        results[f"{name}[{size}]"] = result
+                        print(f"{name}[{size}]: {result['median'] * 1000:.3f} ms", flush=True)
+            finally:
+                os.chdir(working_directory)
+
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "sizes": sizes,
+        "results": results,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[str]:
+    """Print the comparison and return names of the benchmarks that got slower than the threshold allows.
+
+    The fastest samples are compared, they are the least disturbed by the rest of the machine.
+    """
+    regressions = []
+    print(f"{'benchmark':<50}{'baseline ms':>14}{'current ms':>14}{'change':>10}")
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            print(f"{name:<50}{'-':>14}{result['min'] * 1000:>14.3f}{'new':>10}")
+            continue
+        baseline_result = baseline["results"][name]
+        change = result["min"] / baseline_result["min"] - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<50}{baseline_result['min'] * 1000:>14.3f}{result['min'] * 1000:>14.3f}{change:>+10.1%}{flag}")
+    for name in baseline["results"]:
+        if name not in current["results"]:
+            print(f"{name:<50}{'missing in current results':>38}")
+    return regressions
+
+
+def load_results(path: str) -> dict:
+    with open(path) as results_file:
+        return json.load(results_file)
+
+
+def save_results(results: dict, path: str) -> None:
+    with open(path, "w") as results_file:
+        json.dump(results, results_file, indent=2)
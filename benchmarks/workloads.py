@@ -0,0 +1,42 @@
+import pickle
+import random
+import socket
+
+from compression import PayloadCompressor
+from constants import MAX_MESSAGES_IN_DISPATCH
+from data_structures import Dispatch, TextMessage
+from protocol import send_frame, receive_frame
+from users import USERS
+
+
+class CountingChannel:
+
+    def __init__(self, sock: socket.socket, compressor: PayloadCompressor) -> None:
+        self.sock = sock
+        self.compressor = compressor
+        self.bytes_sent = 0
+        self.frames_sent = 0
+
+    def send(self, message) -> None:
+        payload = self.compressor.compress(pickle.dumps(message))
+        self.bytes_sent += len(payload) + 4
+        self.frames_sent += 1
+        send_frame(self.sock, payload)
+
+    def receive(self):
+        return pickle.loads(self.compressor.decompress(receive_frame(self.sock)))
+
+
+def generate_history(windows: int, rng: random.Random) -> list[tuple[Dispatch, bool]]:
+    users = list(USERS.values())[1:]
+    history = []
+    for sequence_number in range(windows):
+        for is_received in (False, True):
+            dispatch = Dispatch()
+            for index in range(rng.randrange(1, MAX_MESSAGES_IN_DISPATCH + 1)):
+                dispatch.add_new_text_messages(TextMessage(rng.choice(users), rng.choice(users),
+                                                           f"Subject {sequence_number}/{index}",
+                                                           f"Text of message {rng.getrandbits(64):x}", "12:00:00"))
+            dispatch.sequence_number = sequence_number
+            history.append((dispatch, is_received))
+    return history
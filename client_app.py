@@ -1,6 +1,5 @@
 import socket
 import logging
-import subprocess
 from datetime import datetime
 
 from textual import events
@@ -9,8 +8,10 @@ from textual.widgets import Header, Footer
 from textual_countdown import Countdown
 
 from app import BaseApp
-from constants import SECONDS_BETWEEN_DISPATCHES, CLIENT_LOG
+from constants import SECONDS_BETWEEN_DISPATCHES, CLIENT_LOG, CLIENT_SESSION_LOG
 from data_structures import User, TextMessage, Dispatch, decode_card_id, KEY_MAPPINGS
+from history_sync import HistorySynchronizer, TO_EARTH
+from printer import print_dispatch
 from users import USERS, get_user_by_id
 from user_interface import UserInfoDisplay, TimeDisplay, MainDisplay, TextMessageInput
 
@@ -20,16 +21,29 @@ class ClientMainDisplay(MainDisplay):
     def encrypt_all_dispatches_of_user(self, user: User) -> None:
         for dispatch_display in self.dispatch_displays:
             dispatch_display.dispatch.encrypt_all_messages_of_user(user)
+        self.close_private_search_index()
 
     def decrypt_all_dispatches_of_user(self, user: User) -> None:
         for dispatch_display in self.dispatch_displays:
             dispatch_display.dispatch.decrypt_all_messages_of_user(user)
+        self.open_private_search_index(user)
+
+    def refresh_text_messages_of_user(self, user: User) -> None:
+        # only the texts of the user change, recomposing the whole history would take longer with every window
+        for dispatch_display in self.dispatch_displays:
+            for text_message_display in dispatch_display.children:
+                text_message = text_message_display.text_message
+                if text_message.sender == user or text_message.recipient == user:
+                    text_message_display.refresh_text()
 
 
 class ClientApp(BaseApp):
-    BINDINGS = [("o,O", "log_out", "Log out"), ("w,W", "write_message", "Write message")]
+    BINDINGS = [("o,O", "log_out", "Log out"), ("w,W", "write_message", "Write message"), ("ctrl+f", "search", "Search")]
 
     peer = socket.socket()
+    outgoing_direction = TO_EARTH
+    session_log = CLIENT_SESSION_LOG
+    log_file = CLIENT_LOG
 
     def __init__(self):
         super().__init__()
@@ -37,24 +51,24 @@ class ClientApp(BaseApp):
         self.submitted_id = ""
 
     def on_mount(self):
-        logging.basicConfig(filename=CLIENT_LOG, encoding="utf-8", level=logging.DEBUG,
+        logging.basicConfig(filename=self.log_file, encoding="utf-8", level=logging.DEBUG,
                             format='%(asctime)s %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p')
         self.logger.info("Client started")
+        self.connect_to_peer()
 
+    def connect_to_peer(self) -> None:
         self.peer.connect((self.host, self.port))
         self.logger.debug(f"Connected to server on {self.host} on port {self.port}")
+        self.exchange_hello()
+        self.reconcile_history()
 
-        self.query_one(Countdown).start(SECONDS_BETWEEN_DISPATCHES)
+        self.fill_dispatch_display_from_queue(self.query_screen_child(ClientMainDisplay).get_last_dispatch_display())
+        self.backup()
+        self.query_screen_child(Countdown).start(SECONDS_BETWEEN_DISPATCHES)
 
     def can_be_message_added_to_dispatch(self, text_message: TextMessage) -> bool:
-        if self.query_one(ClientMainDisplay).get_last_dispatch_display().dispatch.count_messages_by_sender(
+        if self.query_screen_child(ClientMainDisplay).get_last_dispatch_display().dispatch.count_messages_by_sender(
                 self.current_user) == self.current_user.text_message_limit:
-            self.notify(
-                title="Message limit reached",
-                message=f"You cannot add more messages to this dispatch. Your limit is "
-                        f"{self.current_user.text_message_limit} messages. Wait for the next dispatch.",
-                severity="error", timeout=5.0)
-            self.query_one(TextMessageInput).remove()
             self.logger.warning(f"User tried to add message to dispatch but reached his message limit.\n"
                                 f"Message: {text_message}")
             return False
@@ -71,6 +85,7 @@ class ClientApp(BaseApp):
     def handle_login(self):
         parsed_id = decode_card_id(self.submitted_id)
         self.logger.info(f"Parsed_id: {parsed_id}")
+        self.record("login", user_id=parsed_id)
         self.submitted_id = ""
 
         user = get_user_by_id(parsed_id)
@@ -82,10 +97,10 @@ class ClientApp(BaseApp):
         self.current_user = user
 
         if self.current_user.encryption_on:
-            self.query_one(ClientMainDisplay).decrypt_all_dispatches_of_user(self.current_user)
-            self.query_one(ClientMainDisplay).refresh(recompose=True)
+            self.query_screen_child(ClientMainDisplay).decrypt_all_dispatches_of_user(self.current_user)
+            self.query_screen_child(ClientMainDisplay).refresh_text_messages_of_user(self.current_user)
 
-        self.query_one(UserInfoDisplay).user = self.current_user
+        self.query_screen_child(UserInfoDisplay).user = self.current_user
         self.notify(title=f"Welcome", message=f"You successfully logged in as {self.current_user.user_id}",
                     severity="information",
                     timeout=5.0)
@@ -98,11 +113,12 @@ class ClientApp(BaseApp):
                         timeout=5.0)
             return
         if self.current_user.encryption_on:
-            self.query_one(ClientMainDisplay).encrypt_all_dispatches_of_user(self.current_user)
-            self.query_one(ClientMainDisplay).refresh(recompose=True)
+            self.query_screen_child(ClientMainDisplay).encrypt_all_dispatches_of_user(self.current_user)
+            self.query_screen_child(ClientMainDisplay).refresh_text_messages_of_user(self.current_user)
         past_user = self.current_user
+        self.record("logout", user_id=past_user.user_id)
         self.current_user = USERS["no_account"]
-        self.query_one(UserInfoDisplay).user = USERS["no_account"]
+        self.query_screen_child(UserInfoDisplay).user = USERS["no_account"]
         self.notify(title="Goodbye", message="You successfully logged out", severity="information", timeout=5.0)
         self.logger.info(f"User {past_user} logged out")
 
@@ -113,6 +129,20 @@ class ClientApp(BaseApp):
         else:
             super().action_write_message()
 
+    def synchronize_history(self, synchronizer: HistorySynchronizer) -> list[tuple[Dispatch, bool]]:
+        return synchronizer.initiate()
+
+    def queue_text_message(self, text_message: TextMessage, priority: int) -> None:
+        # the queue is kept on disk, so it holds the texts of encrypted accounts encrypted
+        if text_message.sender.encryption_on or text_message.recipient.encryption_on:
+            text_message.encrypt()
+        super().queue_text_message(text_message, priority)
+
+    def handle_text_message_encryption(self, text_message: TextMessage) -> None:
+        if self.current_user.encryption_on and (text_message.sender == self.current_user or
+                                                text_message.recipient == self.current_user):
+            text_message.decrypt()
+
     def handle_encryption(self, received_dispatch: Dispatch) -> None:
         received_dispatch.encrypt_all_messages()
         if self.current_user.encryption_on:
@@ -123,13 +153,7 @@ class ClientApp(BaseApp):
                            datetime.now().strftime("%H:%M:%S"))
 
     def print_dispatch(self, dispatch: Dispatch) -> None:
-        with open("tmp.txt", "w") as f:
-            f.write(dispatch.pretty_print())
-
-        result = subprocess.run(['libreoffice', '--convert-to', 'pdf', 'tmp.txt'], capture_output=True, text=True)
-        self.logger.info(f"Converting to pdf returned: stdout {result.stdout}, stderr {result.stderr}")
-        result = subprocess.run(['lp', 'tmp.pdf'], capture_output=True, text=True)
-        self.logger.info(f"Printing returned: stdout {result.stdout}, stderr {result.stderr}")
+        print_dispatch(dispatch, self.logger)
 
 
 
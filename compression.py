@@ -0,0 +1,107 @@
+import hashlib
+import lzma
+import os
+import pickle
+import zlib
+from collections import Counter
+
+from constants import COMPRESSION_CORPUS_FILE, COMPRESSION_DICTIONARY_SIZE, COMPRESSION_DICTIONARY_SEGMENT, \
+    COMPRESSION_LZMA_MIN_SIZE
+
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_ZLIB_DICTIONARY = 2
+CODEC_LZMA = 3
+
+SUPPORTED_CODECS = (CODEC_NONE, CODEC_ZLIB, CODEC_ZLIB_DICTIONARY, CODEC_LZMA)
+
+
+def train_dictionary(samples: list[bytes], size: int = COMPRESSION_DICTIONARY_SIZE,
+                     segment_length: int = COMPRESSION_DICTIONARY_SEGMENT) -> bytes:
+    """Build a zlib preset dictionary from the segments shared by the most samples"""
+    document_frequency = Counter()
+    for sample in samples:
+        document_frequency.update({sample[i:i + segment_length] for i in range(len(sample) - segment_length + 1)})
+
+    chosen = []
+    dictionary = b""
+    for segment, frequency in sorted(document_frequency.items(), key=lambda item: (-item[1], item[0])):
+        if frequency < 2 or len(dictionary) >= size:
+            break
+        if segment in dictionary:
+            continue
+        chosen.append(segment)
+        dictionary += segment
+
+    # zlib reaches the end of the dictionary with the shortest distances, so the most common segments go last
+    return b"".join(reversed(chosen))[-size:]
+
+
+def load_dictionary(corpus_file: str = COMPRESSION_CORPUS_FILE) -> bytes | None:
+    if not os.path.exists(corpus_file):
+        return None
+    with open(corpus_file, "rb") as corpus:
+        dispatches = pickle.load(corpus)
+    samples = [pickle.dumps(dispatch) for dispatch, _ in dispatches if dispatch.text_messages]
+    if not samples:
+        return None
+    return train_dictionary(samples)
+
+
+class PayloadCompressor:
+
+    def __init__(self, dictionary: bytes | None = None) -> None:
+        self.dictionary = dictionary
+        self.codecs = [codec for codec in SUPPORTED_CODECS if codec != CODEC_ZLIB_DICTIONARY or dictionary]
+
+    @property
+    def dictionary_id(self) -> str | None:
+        if not self.dictionary:
+            return None
+        return hashlib.sha256(self.dictionary).hexdigest()[:16]
+
+    def hello(self) -> dict:
+        return {"codecs": list(self.codecs), "dictionary_id": self.dictionary_id}
+
+    def negotiate(self, peer_hello: dict) -> None:
+        self.codecs = [codec for codec in self.codecs if codec in peer_hello["codecs"]]
+        if peer_hello["dictionary_id"] != self.dictionary_id and CODEC_ZLIB_DICTIONARY in self.codecs:
+            self.codecs.remove(CODEC_ZLIB_DICTIONARY)
+
+    def compress_with(self, codec: int, data: bytes) -> bytes:
+        if codec == CODEC_ZLIB:
+            return zlib.compress(data, 9)
+        if codec == CODEC_ZLIB_DICTIONARY:
+            compressor = zlib.compressobj(9, zdict=self.dictionary)
+            return compressor.compress(data) + compressor.flush()
+        if codec == CODEC_LZMA:
+            return lzma.compress(data)
+        return data
+
+    def compress(self, data: bytes) -> bytes:
+        best_codec, best_data = CODEC_NONE, data
+        for codec in self.codecs:
+            if codec == CODEC_NONE or codec == CODEC_LZMA and len(data) < COMPRESSION_LZMA_MIN_SIZE:
+                continue
+            # zlib goes first, when it cannot shrink the data at all (attachment chunks), lzma would only waste time
+            if codec == CODEC_LZMA and best_codec == CODEC_NONE and CODEC_ZLIB in self.codecs:
+                continue
+            compressed = self.compress_with(codec, data)
+            if len(compressed) < len(best_data):
+                best_codec, best_data = codec, compressed
+        return bytes([best_codec]) + best_data
+
+    def decompress(self, payload: bytes) -> bytes:
+        codec, data = payload[0], payload[1:]
+        if codec == CODEC_NONE:
+            return data
+        if codec == CODEC_ZLIB:
+            return zlib.decompress(data)
+        if codec == CODEC_ZLIB_DICTIONARY:
+            if not self.dictionary:
+                raise ValueError("Received payload compressed with a dictionary that is not available")
+            decompressor = zlib.decompressobj(zdict=self.dictionary)
+            return decompressor.decompress(data) + decompressor.flush()
+        if codec == CODEC_LZMA:
+            return lzma.decompress(data)
+        raise ValueError(f"Unknown payload codec {codec}")
@@ -7,10 +7,42 @@ SECONDS_BETWEEN_CONNECTION_CHECKS = 5
 ###
 
 BACKUP_FILE = "backup.pkl"
+OUTBOUND_QUEUE_FILE = "outbound_queue.pkl"
 CLIENT_LOG = "client.log"
 SERVER_LOG = "server.log"
+CLIENT_SESSION_LOG = "client_session.jsonl.gz"
+SERVER_SESSION_LOG = "server_session.jsonl.gz"
+RECORD_SESSIONS = False
+BROKER_SOCKET = "outpost_broker.sock"
+BROKER_LOG = "broker.log"
+TERMINAL_LOG = "terminal.log"
+ATTACHMENT_DIRECTORY = "attachments"
+ATTACHMENTS_STATE_FILE = "attachments.pkl"
 
 ###
 
 SERVER_IP = "192.168.1.110"
-SERVER_PORT = 12345
\ No newline at end of file
+SERVER_PORT = 12345
+
+###
+
+COMPRESSION_CORPUS_FILE = "backup_1_run.pkl"
+COMPRESSION_DICTIONARY_SIZE = 32768
+COMPRESSION_DICTIONARY_SEGMENT = 16
+COMPRESSION_LZMA_MIN_SIZE = 65536
+
+###
+
+SYNC_TOP_RANGE_SIZE = 4096
+SYNC_FANOUT = 16
+SYNC_LEAF_SIZE = 16
+SYNC_BATCH_SIZE = 50
+
+###
+
+SEARCH_RESULT_LIMIT = 100
+
+###
+
+ATTACHMENT_CHUNK_SIZE = 16384
+ATTACHMENT_CHUNKS_PER_FREE_SLOT = 8
@@ -1,5 +1,6 @@
 import base64
 import textwrap
+import zlib
 
 from constants import MAX_MESSAGES_IN_DISPATCH
 
@@ -18,7 +19,45 @@ class User:
         return self.user_id == other.user_id
 
 
+class Attachment:
+    """File sent along with a text message, its content goes in chunks over the following windows"""
+
+    def __init__(self, name: str, size: int, sha256: str, chunk_size: int) -> None:
+        self.name = name
+        self.size = size
+        self.sha256 = sha256
+        self.chunk_size = chunk_size
+
+    @property
+    def attachment_id(self) -> str:
+        return self.sha256
+
+    @property
+    def chunk_count(self) -> int:
+        return -(-self.size // self.chunk_size)
+
+    def __str__(self):
+        return f"{self.name} ({self.size} B)"
+
+
+class AttachmentChunk:
+
+    def __init__(self, attachment: Attachment, index: int, data: bytes) -> None:
+        self.attachment = attachment
+        self.index = index
+        self.data = data
+        self.checksum = zlib.crc32(data)
+
+    @property
+    def is_valid(self) -> bool:
+        expected_size = min(self.attachment.chunk_size, self.attachment.size - self.index * self.attachment.chunk_size)
+        return (0 <= self.index < self.attachment.chunk_count and len(self.data) == expected_size and
+                zlib.crc32(self.data) == self.checksum)
+
+
 class TextMessage:
+    # messages from older backups were created before attachments existed
+    attachment: Attachment | None = None
 
     def __init__(self, sender: User, recipient: User, subject: str, text: str, time_added: str) -> None:
         self.time_added = time_added
@@ -40,6 +79,12 @@ class TextMessage:
         self.text = base64.b64decode(self.text).decode()
         self.is_encrypted = False
 
+    @property
+    def plain_text(self) -> str:
+        if self.is_encrypted:
+            return base64.b64decode(self.text).decode()
+        return self.text
+
     def pretty_print(self) -> str:
         message = (f"-" * 70 + f"\n" +
                    f"Header\n" +
@@ -48,6 +93,7 @@ class TextMessage:
                    f"Sender: {self.sender.user_id}\n" +
                    f"Recipient: {self.recipient.user_id}\n" +
                    f"Subject: {self.subject}\n" +
+                   (f"Attachment: {self.attachment}\n" if self.attachment is not None else "") +
                    f"-" * 70 + f"\n" +
                    f"Body\n" +
                    f"-" * 70 + f"\n")
@@ -59,11 +105,17 @@ class TextMessage:
                 f"Sender: {self.sender}\n"
                 f"Recipient: {self.recipient}\n"
                 f"Subject: {self.subject}\n"
-                f"Text: {self.text}\n")
+                f"Text: {self.text}\n" +
+                (f"Attachment: {self.attachment}\n" if self.attachment is not None else ""))
 
 
 class Dispatch:
     max_text_messages = MAX_MESSAGES_IN_DISPATCH
+    # assigned by the sending side when the dispatch leaves, dispatches from older backups stay without it
+    sequence_number: int | None = None
+    # set only while the dispatch is on its way, the chunks use the message slots the dispatch left free
+    attachment_chunks: tuple[AttachmentChunk, ...] = ()
+    attachment_acknowledgements: tuple[tuple[str, list[tuple[int, int]]], ...] = ()
 
     def __init__(self, *text_messages: TextMessage) -> None:
         self.text_messages = []
@@ -0,0 +1,44 @@
+import os
+import pickle
+
+from constants import BACKUP_FILE
+from data_structures import Dispatch
+
+
+def save_backup(dispatches: list[tuple[Dispatch, bool]], backup_file: str = BACKUP_FILE) -> None:
+    # dispatches without messages are left out, an empty backup would not be worth restoring
+    dispatches = [(dispatch, is_received) for dispatch, is_received in dispatches if dispatch.text_messages]
+    if dispatches:
+        with open(backup_file, "wb") as backup:
+            pickle.dump(dispatches, backup)
+
+
+def load_backup(backup_file: str = BACKUP_FILE) -> tuple[list[tuple[Dispatch, bool]], Dispatch]:
+    """History and the open dispatch. The backup keeps the open dispatch last when it has messages, it is the one
+    that was neither received nor given a sequence number by sending it."""
+    if not os.path.exists(backup_file) or os.stat(backup_file).st_size < 50:
+        return [], Dispatch()
+    with open(backup_file, "rb") as backup:
+        history = [(dispatch, is_received) for dispatch, is_received in pickle.load(backup) if dispatch.text_messages]
+    if history and not history[-1][1] and history[-1][0].sequence_number is None:
+        return history[:-1], history[-1][0]
+    return history, Dispatch()
+
+
+def next_sequence_number(history: list[tuple[Dispatch, bool]]) -> int:
+    sequence_numbers = [dispatch.sequence_number for dispatch, is_received in history
+                        if not is_received and dispatch.sequence_number is not None]
+    return max(sequence_numbers, default=-1) + 1
+
+
+def merge_history(history: list[tuple[Dispatch, bool]],
+                  dispatches: list[tuple[Dispatch, bool]]) -> list[tuple[Dispatch, bool]]:
+    """History with the dispatches added, a dispatch with the same sequence number and direction is replaced.
+    Dispatches never sent stay first, the rest is ordered by sequence number."""
+    dispatches_by_key = {(dispatch.sequence_number, is_received): (dispatch, is_received)
+                         for dispatch, is_received in history if dispatch.sequence_number is not None}
+    for dispatch, is_received in dispatches:
+        dispatches_by_key[(dispatch.sequence_number, is_received)] = (dispatch, is_received)
+    unsequenced_dispatches = [(dispatch, is_received) for dispatch, is_received in history
+                              if dispatch.sequence_number is None]
+    return unsequenced_dispatches + [dispatches_by_key[key] for key in sorted(dispatches_by_key)]
@@ -0,0 +1,139 @@
+import hashlib
+import struct
+from bisect import bisect_left
+from typing import Any, Callable
+
+from constants import SYNC_TOP_RANGE_SIZE, SYNC_FANOUT, SYNC_LEAF_SIZE, SYNC_BATCH_SIZE
+from data_structures import Dispatch
+
+TO_EARTH = 0
+FROM_EARTH = 1
+
+KEY_FORMAT = struct.Struct("!QB")
+
+
+def dispatch_digest(dispatch: Dispatch) -> bytes:
+    """Digest of the readable content, so the encryption state of either side does not matter"""
+    content = tuple((text_message.time_added, text_message.sender.user_id, text_message.recipient.user_id,
+                     text_message.subject, text_message.plain_text) for text_message in dispatch.text_messages)
+    return hashlib.sha256(repr(content).encode()).digest()[:16]
+
+
+class SyncHistory:
+    """Dispatch history keyed by (sequence number, direction)"""
+
+    def __init__(self, dispatches: list[tuple[Dispatch, bool]], outgoing_direction: int) -> None:
+        self.outgoing_direction = outgoing_direction
+        self.dispatches: dict[tuple[int, int], Dispatch] = {}
+        self.digests: dict[tuple[int, int], bytes] = {}
+        for dispatch, is_received in dispatches:
+            if dispatch.sequence_number is None:
+                continue
+            key = (dispatch.sequence_number, self.direction(is_received))
+            self.dispatches[key] = dispatch
+            self.digests[key] = dispatch_digest(dispatch)
+        self.keys = sorted(self.dispatches)
+
+    def direction(self, is_received: bool) -> int:
+        return 1 - self.outgoing_direction if is_received else self.outgoing_direction
+
+    def is_received(self, key: tuple[int, int]) -> bool:
+        return key[1] != self.outgoing_direction
+
+    def is_authoritative(self, key: tuple[int, int]) -> bool:
+        return key[1] == self.outgoing_direction
+
+    @property
+    def max_sequence_number(self) -> int:
+        return self.keys[-1][0] if self.keys else -1
+
+    def keys_in_range(self, start: int, end: int) -> list[tuple[int, int]]:
+        return self.keys[bisect_left(self.keys, (start, -1)):bisect_left(self.keys, (end, -1))]
+
+    def range_hash(self, start: int, end: int) -> bytes:
+        range_hash = hashlib.sha256()
+        for key in self.keys_in_range(start, end):
+            range_hash.update(KEY_FORMAT.pack(*key))
+            range_hash.update(self.digests[key])
+        return range_hash.digest()[:8]
+
+
+class HistorySynchronizer:
+    """Reconcile two histories by comparing range hashes and exchanging only the differing dispatches.
+
+    The initiator narrows mismatching sequence ranges down to leaves, the responder answers with what it
+    is missing and sends what the initiator is missing. When both sides hold a different dispatch under
+    the same key, the side that sent it wins.
+    """
+
+    def __init__(self, history: SyncHistory, send: Callable[[Any], None], receive: Callable[[], Any]) -> None:
+        self.history = history
+        self.send = send
+        self.receive = receive
+
+    def initiate(self) -> list[tuple[Dispatch, bool]]:
+        self.send({"type": "sync_start", "max_sequence_number": self.history.max_sequence_number})
+        end = max(self.history.max_sequence_number, self.receive()["max_sequence_number"]) + 1
+
+        pending = [(start, min(start + SYNC_TOP_RANGE_SIZE, end)) for start in range(0, end, SYNC_TOP_RANGE_SIZE)]
+        leaves = []
+        while pending:
+            self.send({"type": "range_hashes",
+                       "ranges": [(start, end, self.history.range_hash(start, end)) for start, end in pending]})
+            pending = []
+            for start, end in self.receive()["ranges"]:
+                if end - start <= SYNC_LEAF_SIZE:
+                    leaves.append((start, end))
+                    continue
+                step = -(-(end - start) // SYNC_FANOUT)
+                pending += [(sub_start, min(sub_start + step, end)) for sub_start in range(start, end, step)]
+
+        self.send({"type": "leaf_digests", "ranges": leaves,
+                   "digests": {key: self.history.digests[key]
+                               for start, end in leaves for key in self.history.keys_in_range(start, end)}})
+        wanted = self.receive()["wanted"]
+        received = self.receive_dispatches()
+        self.send_dispatches(wanted)
+        return received
+
+    def respond(self) -> list[tuple[Dispatch, bool]]:
+        self.receive()
+        self.send({"type": "sync_start", "max_sequence_number": self.history.max_sequence_number})
+
+        while True:
+            message = self.receive()
+            if message["type"] == "range_hashes":
+                self.send({"type": "mismatched_ranges",
+                           "ranges": [(start, end) for start, end, range_hash in message["ranges"]
+                                      if self.history.range_hash(start, end) != range_hash]})
+            elif message["type"] == "leaf_digests":
+                break
+
+        peer_digests = message["digests"]
+        to_send = []
+        for start, end in message["ranges"]:
+            for key in self.history.keys_in_range(start, end):
+                if key not in peer_digests or (peer_digests[key] != self.history.digests[key]
+                                               and self.history.is_authoritative(key)):
+                    to_send.append(key)
+        wanted = [key for key, digest in peer_digests.items()
+                  if key not in self.history.digests or (digest != self.history.digests[key]
+                                                         and not self.history.is_authoritative(key))]
+
+        self.send({"type": "wanted", "wanted": wanted})
+        self.send_dispatches(to_send)
+        return self.receive_dispatches()
+
+    def send_dispatches(self, keys: list[tuple[int, int]]) -> None:
+        for batch_start in range(0, max(len(keys), 1), SYNC_BATCH_SIZE):
+            batch = keys[batch_start:batch_start + SYNC_BATCH_SIZE]
+            self.send({"type": "dispatches", "entries": [(key, self.history.dispatches[key]) for key in batch],
+                       "last": batch_start + SYNC_BATCH_SIZE >= len(keys)})
+
+    def receive_dispatches(self) -> list[tuple[Dispatch, bool]]:
+        received = []
+        while True:
+            message = self.receive()
+            received += [(dispatch, self.history.is_received(key)) for key, dispatch in message["entries"]]
+            if message["last"]:
+                return received
@@ -0,0 +1,61 @@
+import heapq
+import os
+import pickle
+
+from constants import OUTBOUND_QUEUE_FILE
+from data_structures import TextMessage, Dispatch
+
+
+class OutboundScheduler:
+    """Messages that did not fit into the open dispatch, waiting for the following windows.
+
+    Every sender has its own queue ordered by priority and age. When a dispatch is packed, the message with
+    the highest priority goes first, ties go to the sender with the fewest messages in the dispatch so far
+    and then to the oldest message. Senders never get more than their text_message_limit in one dispatch.
+    """
+
+    def __init__(self, queue_file: str = OUTBOUND_QUEUE_FILE) -> None:
+        self.queue_file = queue_file
+        self.queues: dict[int, list[tuple[int, int, TextMessage]]] = {}
+        self.next_order = 0
+        self.restore()
+
+    def __len__(self) -> int:
+        return sum(len(queue) for queue in self.queues.values())
+
+    def enqueue(self, text_message: TextMessage, priority: int = 0) -> None:
+        heapq.heappush(self.queues.setdefault(text_message.sender.user_id, []),
+                       (-priority, self.next_order, text_message))
+        self.next_order += 1
+        self.save()
+
+    def pop_next(self, dispatch: Dispatch) -> TextMessage | None:
+        if dispatch.is_full:
+            return None
+        best = None
+        for user_id, queue in self.queues.items():
+            negative_priority, order, text_message = queue[0]
+            messages_in_dispatch = dispatch.count_messages_by_sender(text_message.sender)
+            if messages_in_dispatch >= text_message.sender.text_message_limit:
+                continue
+            rank = (negative_priority, messages_in_dispatch, order)
+            if best is None or rank < best[0]:
+                best = (rank, user_id)
+        if best is None:
+            return None
+
+        _, _, text_message = heapq.heappop(self.queues[best[1]])
+        if not self.queues[best[1]]:
+            del self.queues[best[1]]
+        # the caller saves the queue once the message is backed up in the dispatch, so a crash cannot lose it
+        return text_message
+
+    def save(self) -> None:
+        with open(self.queue_file, "wb") as queue_file:
+            pickle.dump((self.queues, self.next_order), queue_file)
+
+    def restore(self) -> None:
+        if not os.path.exists(self.queue_file) or os.stat(self.queue_file).st_size == 0:
+            return
+        with open(self.queue_file, "rb") as queue_file:
+            self.queues, self.next_order = pickle.load(queue_file)
@@ -0,0 +1,258 @@
+import logging
+import os
+import pickle
+import socket
+import threading
+import time
+from datetime import datetime
+
+from attachments import AttachmentTransfer
+from compression import PayloadCompressor, load_dictionary
+from constants import SECONDS_BETWEEN_DISPATCHES, SERVER_IP, SERVER_PORT, BROKER_SOCKET, BROKER_LOG
+from data_structures import TextMessage, Dispatch, User
+from history_store import save_backup, load_backup, next_sequence_number, merge_history
+from history_sync import SyncHistory, HistorySynchronizer, TO_EARTH
+from outbound_queue import OutboundScheduler
+from printer import print_dispatch
+from protocol import send_frame, receive_frame, exchange_hello, send_object, receive_object
+from users import USERS, get_user_by_id
+
+
+class TerminalSession:
+    """One terminal connected to the broker and the user logged in on it"""
+
+    def __init__(self, connection: socket.socket) -> None:
+        self.connection = connection
+        self.user = USERS["no_account"]
+
+    def send(self, update: dict) -> None:
+        send_frame(self.connection, pickle.dumps(update))
+
+
+class OutpostBroker:
+    """Owns the connection to the Earth and the open dispatch, the terminals of the outpost connect to it
+    over a Unix domain socket.
+
+    A terminal gets the history and the open dispatch when it connects and after that only the changes:
+    messages added to the open dispatch, the sent dispatch closing and the dispatch received from the Earth.
+    Message limits of the users are checked here, so they hold no matter how many terminals a user writes from.
+    Like the client, the broker keeps texts of encrypted accounts encrypted, terminals decrypt them for the
+    user logged in on them.
+    """
+
+    def __init__(self, socket_path: str = BROKER_SOCKET) -> None:
+        self.host = SERVER_IP
+        self.port = SERVER_PORT
+        self.socket_path = socket_path
+        self.logger = logging.getLogger()
+        self.compressor = PayloadCompressor(load_dictionary())
+        self.outbound_scheduler = OutboundScheduler()
+        self.attachment_transfer = AttachmentTransfer()
+        self.peer = socket.socket()
+        # guards the history, the open dispatch and the terminals, updates are sent while holding it so that
+        # every terminal gets them in the same order
+        self.lock = threading.Lock()
+        self.terminals: list[TerminalSession] = []
+        self.history: list[tuple[Dispatch, bool]] = []
+        self.open_dispatch = Dispatch()
+        self.next_window = 0.0
+        self.restore_from_backup()
+
+    def backup(self) -> None:
+        save_backup(self.history + [(self.open_dispatch, False)])
+        # the queue without the messages taken into the open dispatch is saved only once they are in the backup
+        self.outbound_scheduler.save()
+
+    def restore_from_backup(self) -> None:
+        self.history, self.open_dispatch = load_backup()
+
+    def merge_history(self, dispatches: list[tuple[Dispatch, bool]]) -> None:
+        self.history = merge_history(self.history, dispatches)
+        self.backup()
+
+    def exchange_hello(self) -> None:
+        exchange_hello(self.peer, self.compressor)
+
+    def send_object(self, obj) -> None:
+        send_object(self.peer, self.compressor, obj)
+
+    def receive_object(self):
+        return receive_object(self.peer, self.compressor)
+
+    def connect_to_earth(self) -> None:
+        self.peer.connect((self.host, self.port))
+        self.logger.debug(f"Connected to server on {self.host} on port {self.port}")
+        self.exchange_hello()
+
+        synchronizer = HistorySynchronizer(SyncHistory(self.history, TO_EARTH), self.send_object, self.receive_object)
+        try:
+            received_dispatches = synchronizer.initiate()
+        except BaseException as error:
+            self.logger.error(f"History couldn't be synchronized because of the following error: {error}")
+        else:
+            for received_dispatch, _ in received_dispatches:
+                received_dispatch.encrypt_all_messages()
+            self.merge_history(received_dispatches)
+            self.logger.info(f"History was synchronized, {len(received_dispatches)} dispatches were received")
+
+        self.fill_open_dispatch_from_queue()
+        self.next_window = time.monotonic() + SECONDS_BETWEEN_DISPATCHES
+
+    def seconds_to_next_window(self) -> int:
+        return max(0, round(self.next_window - time.monotonic()))
+
+    def broadcast(self, update: dict) -> None:
+        for terminal in self.terminals:
+            try:
+                terminal.send(update)
+            except OSError as error:
+                # the thread serving the terminal notices the closed connection and drops it
+                self.logger.warning(f"Update couldn't be sent to a terminal because of the following error: {error}")
+
+    def add_to_open_dispatch(self, text_message: TextMessage) -> None:
+        self.open_dispatch.add_new_text_messages(text_message)
+        self.broadcast({"type": "message_added", "text_message": text_message})
+        self.logger.info(f"Message was successfully added to dispatch.\n"
+                         f"Message: {text_message}")
+
+    def fill_open_dispatch_from_queue(self) -> None:
+        while (text_message := self.outbound_scheduler.pop_next(self.open_dispatch)) is not None:
+            self.add_to_open_dispatch(text_message)
+        self.backup()
+
+    def can_be_added_to_open_dispatch(self, user: User) -> bool:
+        return (not self.open_dispatch.is_full and
+                self.open_dispatch.count_messages_by_sender(user) < user.text_message_limit)
+
+    def submit_text_message(self, terminal: TerminalSession, request: dict) -> None:
+        if terminal.user == USERS["no_account"]:
+            terminal.send({"type": "error", "title": "Invalid permission",
+                           "message": "You are not logged in. Log in to write messages."})
+            return
+        text_message = TextMessage(terminal.user, USERS["earth"], request["subject"], request["text"],
+                                   datetime.now().strftime("%H:%M:%S"))
+        if text_message.sender.encryption_on or text_message.recipient.encryption_on:
+            text_message.encrypt()
+        if request["attachment_path"] is not None:
+            try:
+                text_message.attachment = self.attachment_transfer.attach(request["attachment_path"])
+            except (OSError, ValueError) as error:
+                self.logger.error(f"File {request['attachment_path']} couldn't be attached because of the following "
+                                  f"error: {error}")
+                terminal.send({"type": "error", "title": "Invalid attachment",
+                               "message": f"The message was not sent, the file cannot be attached: {error}"})
+                return
+
+        if self.can_be_added_to_open_dispatch(terminal.user):
+            self.add_to_open_dispatch(text_message)
+            terminal.send({"type": "submitted", "queued": False})
+            return
+        self.outbound_scheduler.enqueue(text_message, request["priority"])
+        terminal.send({"type": "submitted", "queued": True, "messages_waiting": len(self.outbound_scheduler)})
+        self.logger.info(f"Message was added to the outbound queue with priority {request['priority']}.\n"
+                         f"Message: {text_message}")
+
+    def handle_request(self, terminal: TerminalSession, request: dict) -> None:
+        if request["type"] == "login":
+            user = get_user_by_id(request["user_id"])
+            if user is None:
+                self.logger.info(f"Somebody tried to login with ID {request['user_id']}")
+                terminal.send({"type": "error", "title": "Invalid card",
+                               "message": "Your card is invalid. Inform administrator if the issue persists."})
+                return
+            terminal.user = user
+            self.logger.info(f"User {user} logged in on a terminal")
+        elif request["type"] == "logout":
+            self.logger.info(f"User {terminal.user} logged out on a terminal")
+            terminal.user = USERS["no_account"]
+        elif request["type"] == "submit":
+            self.submit_text_message(terminal, request)
+
+    def serve_terminal(self, connection: socket.socket) -> None:
+        terminal = TerminalSession(connection)
+        try:
+            with self.lock:
+                terminal.send({"type": "snapshot", "history": self.history, "open_dispatch": self.open_dispatch,
+                               "seconds_left": self.seconds_to_next_window()})
+                self.terminals.append(terminal)
+            self.logger.info(f"Terminal connected, {len(self.terminals)} terminals are connected")
+            while (frame := receive_frame(connection)) is not None:
+                with self.lock:
+                    self.handle_request(terminal, pickle.loads(frame))
+        except OSError as error:
+            self.logger.warning(f"Connection to a terminal failed because of the following error: {error}")
+        finally:
+            with self.lock:
+                if terminal in self.terminals:
+                    self.terminals.remove(terminal)
+            connection.close()
+            self.logger.info(f"Terminal disconnected, {len(self.terminals)} terminals are connected")
+
+    def exchange_dispatches(self) -> None:
+        with self.lock:
+            self.fill_open_dispatch_from_queue()
+            dispatch_to_send = self.open_dispatch
+            dispatch_to_send.sequence_number = next_sequence_number(self.history)
+            data = self.attachment_transfer.pack(dispatch_to_send)
+            self.history.append((dispatch_to_send, False))
+            # new messages go to the next dispatch already while this one is on its way
+            self.open_dispatch = Dispatch()
+            self.next_window = time.monotonic() + SECONDS_BETWEEN_DISPATCHES
+            self.broadcast({"type": "dispatch_sent", "sequence_number": dispatch_to_send.sequence_number,
+                            "seconds_left": self.seconds_to_next_window()})
+
+        try:
+            send_frame(self.peer, self.compressor.compress(data))
+            self.logger.info(f"Dispatch has been successfully sent.\n"
+                             f"Dispatch: {dispatch_to_send}")
+            received_dispatch = self.receive_object()
+        except (OSError, ConnectionError) as error:
+            self.logger.error(f"Dispatches couldn't be exchanged because of the following error: {error}")
+            received_dispatch = None
+
+        with self.lock:
+            if received_dispatch is None:
+                self.backup()
+                self.broadcast({"type": "error", "title": "Connection error",
+                                "message": "The dispatches cannot be exchanged due to connection error. "
+                                           "Inform administrator about the problem"})
+            else:
+                self.logger.info(f"New dispatch was received.\n"
+                                 f"Dispatch: {received_dispatch}")
+                for path in self.attachment_transfer.unpack(received_dispatch) or ():
+                    self.broadcast({"type": "attachment_received", "path": os.path.abspath(path)})
+                received_dispatch.encrypt_all_messages()
+                self.merge_history([(received_dispatch, True)])
+                self.broadcast({"type": "dispatch_received", "dispatch": received_dispatch})
+            self.fill_open_dispatch_from_queue()
+
+        if received_dispatch is not None and not received_dispatch.is_empty:
+            print_dispatch(received_dispatch, self.logger)
+
+    def run_windows(self) -> None:
+        while True:
+            time.sleep(max(0.0, self.next_window - time.monotonic()))
+            self.exchange_dispatches()
+
+    def serve_forever(self) -> None:
+        logging.basicConfig(filename=BROKER_LOG, encoding="utf-8", level=logging.DEBUG,
+                            format='%(asctime)s %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p')
+        self.logger.info("Broker started")
+        self.connect_to_earth()
+
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.socket_path)
+        listener.listen()
+        self.logger.info(f"Waiting for terminals on {self.socket_path}")
+
+        threading.Thread(target=self.run_windows, daemon=True).start()
+        while True:
+            connection, _ = listener.accept()
+            threading.Thread(target=self.serve_terminal, args=(connection,), daemon=True).start()
+
+
+if __name__ == "__main__":
+    broker = OutpostBroker()
+    broker.serve_forever()
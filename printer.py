@@ -0,0 +1,14 @@
+import logging
+import subprocess
+
+from data_structures import Dispatch
+
+
+def print_dispatch(dispatch: Dispatch, logger: logging.Logger) -> None:
+    with open("tmp.txt", "w") as f:
+        f.write(dispatch.pretty_print())
+
+    result = subprocess.run(['libreoffice', '--convert-to', 'pdf', 'tmp.txt'], capture_output=True, text=True)
+    logger.info(f"Converting to pdf returned: stdout {result.stdout}, stderr {result.stderr}")
+    result = subprocess.run(['lp', 'tmp.pdf'], capture_output=True, text=True)
+    logger.info(f"Printing returned: stdout {result.stdout}, stderr {result.stderr}")
@@ -0,0 +1,49 @@
+import logging
+import pickle
+import socket
+import struct
+
+from compression import PayloadCompressor
+
+FRAME_HEADER = struct.Struct("!I")
+
+
+def send_frame(sock: socket.socket, payload: bytes) -> None:
+    sock.sendall(FRAME_HEADER.pack(len(payload)) + payload)
+
+
+def receive_exactly(sock: socket.socket, size: int) -> bytes | None:
+    received_data = bytearray()
+    while len(received_data) < size:
+        chunk = sock.recv(min(size - len(received_data), 65536))
+        if not chunk:
+            return None
+        received_data += chunk
+    return bytes(received_data)
+
+
+def receive_frame(sock: socket.socket) -> bytes | None:
+    header = receive_exactly(sock, FRAME_HEADER.size)
+    if header is None:
+        return None
+    (size,) = FRAME_HEADER.unpack(header)
+    return receive_exactly(sock, size)
+
+
+def exchange_hello(sock: socket.socket, compressor: PayloadCompressor) -> None:
+    send_frame(sock, pickle.dumps(compressor.hello()))
+    peer_hello = pickle.loads(receive_frame(sock))
+    compressor.negotiate(peer_hello)
+    logging.getLogger().info(f"Negotiated payload codecs {compressor.codecs} "
+                             f"(dictionary {compressor.dictionary_id}, peer dictionary {peer_hello['dictionary_id']})")
+
+
+def send_object(sock: socket.socket, compressor: PayloadCompressor, obj) -> None:
+    send_frame(sock, compressor.compress(pickle.dumps(obj)))
+
+
+def receive_object(sock: socket.socket, compressor: PayloadCompressor):
+    received_data = receive_frame(sock)
+    if received_data is None:
+        raise ConnectionError("Connection was closed by the peer")
+    return pickle.loads(compressor.decompress(received_data))
@@ -0,0 +1,377 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import queue
+import shutil
+import socket
+import statistics
+import tempfile
+import time
+
+from textual.app import ComposeResult
+from textual.widgets import Header, Footer
+from textual_countdown import Countdown
+
+from client_app import ClientApp, ClientMainDisplay
+from constants import BACKUP_FILE, COMPRESSION_CORPUS_FILE, SECONDS_BETWEEN_DISPATCHES
+from data_structures import Dispatch, KEY_MAPPINGS
+from server_app import ServerApp, ServerMainDisplay
+from session_recorder import read_session, recorded_plain_text
+from user_interface import UserInfoDisplay, TimeDisplay, DispatchDisplay, MainDisplay, TextMessageDisplay, \
+    TextMessageInput
+from users import USERS
+
+CARD_KEYS = {digit: key for key, digit in KEY_MAPPINGS.items()}
+CONNECT_ATTEMPTS = 100
+INPUT_TYPES = ("login", "logout", "message_submitted")
+
+
+def encode_card_id(user_id: int) -> str:
+    return "".join(CARD_KEYS[digit] for digit in f"{user_id:010}")
+
+
+def user_key(user_id: int) -> str:
+    for key in USERS:
+        if USERS[key].user_id == user_id:
+            return key
+
+
+class RetryingSocket(socket.socket):
+    """The server of the replay is started at the same time and may not listen yet"""
+
+    def connect(self, address) -> None:
+        for _ in range(CONNECT_ATTEMPTS - 1):
+            try:
+                return super().connect(address)
+            except ConnectionRefusedError:
+                time.sleep(0.1)
+        super().connect(address)
+
+
+class ReplayTimeDisplay(TimeDisplay):
+
+    def tick(self) -> None:
+        # the replay sends the dispatches at the windows of the schedule, not when the clock runs out
+        pass
+
+
+class ReplayCountdown(Countdown):
+
+    def start(self, countdown: float) -> None:
+        pass
+
+
+class ReplayTextMessageDisplay(TextMessageDisplay):
+    """Nobody looks at the headless apps, the message keeps its place in the history without the widgets showing it"""
+
+    def compose(self) -> ComposeResult:
+        yield from ()
+
+
+class ReplayDispatchDisplay(DispatchDisplay):
+    text_message_display_class = ReplayTextMessageDisplay
+
+
+class ReplayClientMainDisplay(ClientMainDisplay):
+    dispatch_display_class = ReplayDispatchDisplay
+
+
+class ReplayServerMainDisplay(ServerMainDisplay):
+    dispatch_display_class = ReplayDispatchDisplay
+
+
+class ReplayClientApp(ClientApp):
+    # the layout of the whole history would take longer with every window
+    CSS = "MainDisplay { display: none; }"
+
+    def __init__(self, port: int) -> None:
+        super().__init__()
+        self.host = "127.0.0.1"
+        self.port = port
+        self.peer = RetryingSocket()
+
+    def print_dispatch(self, dispatch: Dispatch) -> None:
+        pass
+
+    def notify(self, *args, **kwargs) -> None:
+        # toasts of a replay that runs hundreds of windows a minute only pile up
+        pass
+
+    def create_dispatch_display(self, dispatch: Dispatch, received: bool) -> DispatchDisplay:
+        return ReplayDispatchDisplay(dispatch, received=received)
+
+    def compose(self) -> ComposeResult:
+        yield Header(show_clock=True)
+        yield Footer()
+        yield UserInfoDisplay()
+        yield ReplayTimeDisplay()
+        yield ReplayCountdown()
+        yield ReplayClientMainDisplay()
+
+
+class ReplayServerApp(ServerApp):
+    CSS = ReplayClientApp.CSS
+    notify = ReplayClientApp.notify
+    create_dispatch_display = ReplayClientApp.create_dispatch_display
+
+    def __init__(self, port: int) -> None:
+        super().__init__()
+        self.host = "127.0.0.1"
+        self.port = port
+
+    def compose(self) -> ComposeResult:
+        yield Header(show_clock=True)
+        yield Footer()
+        yield ReplayTimeDisplay()
+        yield ReplayCountdown()
+        yield ReplayServerMainDisplay()
+
+
+def with_plain_text(event: dict) -> dict:
+    """The log keeps the texts of encrypted accounts encrypted, the replayed input types them in plain"""
+    if event["type"] != "message_submitted":
+        return event
+    return {**event, "text": recorded_plain_text(event["text"], event.get("is_encrypted", False)),
+            "is_encrypted": False}
+
+
+def inputs_from_received_dispatches(events: list[dict]) -> list[dict]:
+    """Messages one side received were submitted by the other side before the window they came with"""
+    inputs = []
+    previous_window = 0.0
+    for event in events:
+        if event["type"] != "dispatch_received":
+            continue
+        for sender, recipient, subject, text, is_encrypted, _ in event["messages"]:
+            inputs.append({"t": previous_window, "type": "message_submitted", "sender": sender,
+                           "recipient": recipient, "subject": subject,
+                           "text": recorded_plain_text(text, is_encrypted), "priority": 0})
+        previous_window = event["t"]
+    return inputs
+
+
+def clock_offset(client_events: list[dict], server_events: list[dict]) -> float:
+    """Seconds to add to the times of the server log to get the clock of the client log, each counts from its own start.
+
+    The server receives a dispatch at the exchange the client sends it at, when the logs share no such dispatch
+    the first dispatches sent by both are taken as the same exchange.
+    """
+    sent_times = {event["sequence_number"]: event["t"] for event in client_events if event["type"] == "dispatch_sent"}
+    for event in server_events:
+        if event["type"] == "dispatch_received" and event["sequence_number"] in sent_times:
+            return sent_times[event["sequence_number"]] - event["t"]
+    client_sent = [event["t"] for event in client_events if event["type"] == "dispatch_sent"]
+    server_sent = [event["t"] for event in server_events if event["type"] == "dispatch_sent"]
+    if client_sent and server_sent:
+        return client_sent[0] - server_sent[0]
+    return 0.0
+
+
+def build_schedules(client_events: list[dict] | None, server_events: list[dict] | None,
+                    window_limit: int | None) -> tuple[list[dict], list[dict], list[float]]:
+    if client_events is not None and server_events is not None:
+        offset = clock_offset(client_events, server_events)
+        server_events = [{**event, "t": event["t"] + offset} for event in server_events]
+    events = client_events if client_events is not None else server_events
+    windows = [event["t"] for event in events if event["type"] == "dispatch_sent"][:window_limit]
+
+    if client_events is not None:
+        client_inputs = [with_plain_text(event) for event in client_events if event["type"] in INPUT_TYPES]
+    else:
+        client_inputs = inputs_from_received_dispatches(server_events)
+    if server_events is not None:
+        server_inputs = [with_plain_text(event) for event in server_events if event["type"] == "message_submitted"]
+    else:
+        server_inputs = inputs_from_received_dispatches(client_events)
+
+    if windows:
+        client_inputs = [event for event in client_inputs if event["t"] <= windows[-1]]
+        server_inputs = [event for event in server_inputs if event["t"] <= windows[-1]]
+    return client_inputs, server_inputs, windows
+
+
+def log_in(app: ReplayClientApp, user_id: int) -> None:
+    app.submitted_id = encode_card_id(user_id)
+    app.handle_login()
+
+
+def apply_input(app: ClientApp | ServerApp, event: dict) -> None:
+    if event["type"] == "login":
+        log_in(app, event["user_id"])
+    elif event["type"] == "logout":
+        app.action_log_out()
+    elif event["type"] == "message_submitted":
+        if isinstance(app, ClientApp) and app.current_user.user_id != event["sender"]:
+            if app.current_user != USERS["no_account"]:
+                app.action_log_out()
+            log_in(app, event["sender"])
+        # the message goes the way of a submitted input, without composing the input widget for it
+        submitted = TextMessageInput.TextMessageSubmitted(None, user_key(event["recipient"]), event["subject"],
+                                                          event["text"], event.get("priority", 0))
+        app.submit_text_message(app.create_text_message(submitted), submitted.priority)
+
+
+def run_window(app: ClientApp | ServerApp, window: int, simulated_time: float,
+               submitted: dict[tuple, list[float]]) -> dict:
+    main_display = app.query_screen_child(MainDisplay)
+    sent_dispatch = main_display.get_last_dispatch_display().dispatch
+
+    start = time.perf_counter()
+    app.handle_incoming_and_outgoing_dispatch()
+    exchange_time = time.perf_counter() - start
+
+    received_display = main_display.dispatch_displays[-2]
+    received = len(received_display.dispatch.text_messages) if received_display.is_received else 0
+    latencies = []
+    for text_message in sent_dispatch.text_messages:
+        submission_times = submitted.get((text_message.sender.user_id, text_message.subject, text_message.plain_text))
+        if submission_times:
+            latencies.append(simulated_time - submission_times.pop(0))
+    return {"window": window, "simulated_time": simulated_time, "exchange_ms": exchange_time * 1000,
+            "sent": len(sent_dispatch.text_messages), "received": received,
+            "queued": len(app.outbound_scheduler),
+            "latency_mean_s": statistics.mean(latencies) if latencies else None,
+            "latency_max_s": max(latencies) if latencies else None}
+
+
+async def drive(app: ClientApp | ServerApp, inputs: list[dict], windows: list[float], speed: float) -> dict:
+    # an input at the time of a window comes after it, the derived inputs get the time of the window before theirs
+    timeline = sorted([(event["t"], 1, event) for event in inputs] + [(t, 0, None) for t in windows],
+                      key=lambda item: (item[0], item[1]))
+    submitted = {}
+    report = []
+    async with app.run_test(headless=True):
+        start = time.perf_counter()
+        for simulated_time, is_input, event in timeline:
+            if speed:
+                delay = start + simulated_time / speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            if is_input:
+                if event["type"] == "message_submitted":
+                    submitted.setdefault((event["sender"], event["subject"], event["text"]), []).append(simulated_time)
+                apply_input(app, event)
+            else:
+                report.append(run_window(app, len(report), simulated_time, submitted))
+            # let the app process the mounts and messages caused by the step
+            await asyncio.sleep(0)
+        duration = time.perf_counter() - start
+    return {"duration_s": duration, "windows": report}
+
+
+def replay_role(role: str, inputs: list[dict], windows: list[float], speed: float, port: int, workdir: str,
+                results: multiprocessing.Queue) -> None:
+    os.chdir(workdir)
+    open(BACKUP_FILE, "wb").close()
+    app = ReplayClientApp(port) if role == "client" else ReplayServerApp(port)
+    results.put((role, asyncio.run(drive(app, inputs, windows, speed))))
+
+
+def summarize(role: str, result: dict) -> dict:
+    windows = result["windows"]
+    exchange_times = sorted(window["exchange_ms"] for window in windows)
+    latencies = [window["latency_max_s"] for window in windows if window["latency_max_s"] is not None]
+    sent = sum(window["sent"] for window in windows)
+    return {
+        "role": role,
+        "windows": len(windows),
+        "duration_s": result["duration_s"],
+        "windows_per_s": len(windows) / result["duration_s"] if result["duration_s"] else None,
+        "messages_sent": sent,
+        "messages_per_s": sent / result["duration_s"] if result["duration_s"] else None,
+        "exchange_ms_median": statistics.median(exchange_times) if exchange_times else None,
+        "exchange_ms_p95": exchange_times[int(len(exchange_times) * 0.95)] if exchange_times else None,
+        "exchange_ms_max": exchange_times[-1] if exchange_times else None,
+        "message_latency_max_s": max(latencies) if latencies else None,
+        "messages_left_in_queue": windows[-1]["queued"] if windows else 0,
+    }
+
+
+def print_report(summaries: list[dict], results: dict, per_window: bool) -> None:
+    for summary in summaries:
+        role = summary["role"]
+        if not summary["windows"]:
+            print(f"{role}: no windows were replayed")
+            continue
+        if per_window:
+            print(f"{role}: {'window':>6}{'time s':>10}{'exchange ms':>13}{'sent':>6}{'received':>10}{'queued':>8}"
+                  f"{'latency s':>11}")
+            for window in results[role]["windows"]:
+                latency = "" if window["latency_max_s"] is None else f"{window['latency_max_s']:.0f}"
+                print(f"{role}: {window['window']:>6}{window['simulated_time']:>10.0f}{window['exchange_ms']:>13.2f}"
+                      f"{window['sent']:>6}{window['received']:>10}{window['queued']:>8}{latency:>11}")
+        print(f"{role}: {summary['windows']} windows in {summary['duration_s']:.2f} s "
+              f"({summary['windows_per_s']:.1f} windows/s, {summary['messages_per_s']:.1f} messages/s), "
+              f"exchange median {summary['exchange_ms_median']:.2f} ms, p95 {summary['exchange_ms_p95']:.2f} ms, "
+              f"max {summary['exchange_ms_max']:.2f} ms, {summary['messages_left_in_queue']} messages left in queue")
+
+
+def find_free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def replay(client_inputs: list[dict], server_inputs: list[dict], windows: list[float], speed: float) -> dict:
+    """Replay the schedules, each side in its own process, and return the results of both sides by role"""
+    port = find_free_port()
+    context = multiprocessing.get_context("spawn")
+    results_queue = context.Queue()
+    with tempfile.TemporaryDirectory() as client_directory, tempfile.TemporaryDirectory() as server_directory:
+        # both sides get their own backup and queue files, and the same dictionary as the live apps
+        for directory in (client_directory, server_directory):
+            if os.path.exists(COMPRESSION_CORPUS_FILE):
+                shutil.copy(COMPRESSION_CORPUS_FILE, directory)
+        processes = [
+            context.Process(target=replay_role, args=("server", server_inputs, windows, speed, port,
+                                                      server_directory, results_queue)),
+            context.Process(target=replay_role, args=("client", client_inputs, windows, speed, port,
+                                                      client_directory, results_queue)),
+        ]
+        for process in processes:
+            process.start()
+        results = {}
+        while len(results) < len(processes):
+            try:
+                role, result = results_queue.get(timeout=1)
+                results[role] = result
+            except queue.Empty:
+                if any(process.exitcode not in (None, 0) for process in processes):
+                    for process in processes:
+                        process.terminate()
+                    raise SystemExit("Replay of one of the sides failed, see the output above")
+        for process in processes:
+            process.join()
+
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay recorded sessions against headless client and server")
+    parser.add_argument("--client-log", help="session log recorded by the client")
+    parser.add_argument("--server-log", help="session log recorded by the server")
+    parser.add_argument("--speed", type=float, default=SECONDS_BETWEEN_DISPATCHES,
+                        help="how many times faster than recorded, 0 replays as fast as possible")
+    parser.add_argument("--windows", type=int, help="replay only this many windows")
+    parser.add_argument("--per-window", action="store_true", help="print every window")
+    parser.add_argument("--report", help="store the report as JSON")
+    arguments = parser.parse_args()
+    if arguments.client_log is None and arguments.server_log is None:
+        parser.error("at least one of --client-log and --server-log is required")
+
+    client_events = read_session(arguments.client_log) if arguments.client_log else None
+    server_events = read_session(arguments.server_log) if arguments.server_log else None
+    client_inputs, server_inputs, windows = build_schedules(client_events, server_events, arguments.windows)
+    results = replay(client_inputs, server_inputs, windows, arguments.speed)
+
+    summaries = [summarize(role, results[role]) for role in ("client", "server")]
+    print_report(summaries, results, arguments.per_window)
+    if arguments.report:
+        with open(arguments.report, "w") as report:
+            json.dump({"summaries": summaries, "results": results}, report, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import heapq
+import re
+import unicodedata
+from array import array
+from bisect import bisect_left, insort
+from functools import lru_cache
+from typing import Iterable
+
+from constants import SEARCH_RESULT_LIMIT
+
+TOKEN_PATTERN = re.compile(r"\w+")
+BISECT_COST = 20
+LAST_CHARACTER = chr(0x10FFFF)
+
+
+@lru_cache(maxsize=65536)
+def fold_token(token: str) -> str:
+    if token.isascii():
+        return token
+    return "".join(letter for letter in unicodedata.normalize("NFKD", token) if not unicodedata.combining(letter))
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercase words without diacritics, so "hlaseni" finds "Hlášení" """
+    return [fold_token(token) for token in TOKEN_PATTERN.findall(text.casefold())]
+
+
+def posting_contains(posting: array, document_id: int) -> bool:
+    index = bisect_left(posting, document_id)
+    return index < len(posting) and posting[index] == document_id
+
+
+class SearchIndex:
+    """Inverted index from words to sorted arrays of document ids.
+
+    Documents are expected to be added with growing ids, removed ones are only remembered and skipped.
+    The last word of a query matches as a prefix, results are returned from the highest id down.
+    """
+
+    def __init__(self) -> None:
+        self.postings: dict[str, array] = {}
+        self.terms: list[str] = []
+        self.removed: set[int] = set()
+
+    def add(self, document_id: int, text: str) -> None:
+        for term in set(tokenize(text)):
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = array("I")
+                insort(self.terms, term)
+            if posting and posting[-1] > document_id:
+                insort(posting, document_id)
+            else:
+                posting.append(document_id)
+        self.removed.discard(document_id)
+
+    def remove(self, document_id: int) -> None:
+        self.removed.add(document_id)
+
+    def terms_with_prefix(self, prefix: str) -> list[str]:
+        # all of them, a short prefix matches many terms and any of them may hold the newest document,
+        # the merge of their postings stops at the limit anyway
+        return self.terms[bisect_left(self.terms, prefix):bisect_left(self.terms, prefix + LAST_CHARACTER)]
+
+    def newest(self, document_ids: Iterable[int], limit: int) -> list[int]:
+        results = []
+        for document_id in document_ids:
+            if document_id in self.removed or results and results[-1] == document_id:
+                continue
+            results.append(document_id)
+            if len(results) == limit:
+                break
+        return results
+
+    def search(self, query: str, limit: int = SEARCH_RESULT_LIMIT) -> list[int]:
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        exact_postings = [self.postings.get(token) for token in tokens[:-1]]
+        prefix_postings = [self.postings[term] for term in self.terms_with_prefix(tokens[-1])]
+        if None in exact_postings or not prefix_postings:
+            return []
+
+        if not exact_postings:
+            return self.newest(heapq.merge(*(reversed(posting) for posting in prefix_postings), reverse=True), limit)
+
+        exact_postings.sort(key=len)
+        candidates = set(exact_postings[0])
+        for posting in exact_postings[1:]:
+            candidates.intersection_update(posting)
+
+        matches = set()
+        for posting in sorted(prefix_postings, key=len, reverse=True):
+            if not candidates:
+                break
+            # few candidates are cheaper to look up than walking the whole posting
+            if len(candidates) * BISECT_COST < len(posting):
+                found = {document_id for document_id in candidates if posting_contains(posting, document_id)}
+            else:
+                found = candidates.intersection(posting)
+            matches |= found
+            candidates -= found
+        return self.newest(sorted(matches, reverse=True), limit)
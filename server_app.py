@@ -8,12 +8,16 @@ from textual.widgets import Header, Footer, Select, Label, Input, Button
 from textual_countdown import Countdown
 
 from app import BaseApp
-from constants import SECONDS_BETWEEN_DISPATCHES, SERVER_LOG
+from constants import SECONDS_BETWEEN_DISPATCHES, SERVER_LOG, SERVER_SESSION_LOG
 from data_structures import TextMessage, Dispatch, User
+from history_sync import HistorySynchronizer, FROM_EARTH
 from users import USERS
 from user_interface import TimeDisplay, TextMessageInput, DispatchDisplay, MainDisplay, TextMessageDisplay
 
 
+PRIORITIES = [("Normal", 0), ("High", 1), ("Urgent", 2)]
+
+
 class ServerTextMessageDisplay(TextMessageDisplay):
 
     def display_user(self, user: User):
@@ -28,6 +32,10 @@ class ServerMainDisplay(MainDisplay):
 
     dispatch_display_class = ServerDispatchDisplay
 
+    def is_text_readable_by_everyone(self, text_message: TextMessage) -> bool:
+        # Earth receives every message decrypted
+        return True
+
 
 
 class ServerTextMessageInput(TextMessageInput):
@@ -48,14 +56,20 @@ class ServerTextMessageInput(TextMessageInput):
         subject = self.query_one("#subject").value
         text = self.query_one("#text").value
         recipient = self.query_one("#recipient").value
+        priority = self.query_one("#priority").value
 
-        self.post_message(self.TextMessageSubmitted(None, recipient, subject, text))
+        self.post_message(self.TextMessageSubmitted(None, recipient, subject, text, priority,
+                                                    self.get_attachment_path()))
 
     def on_input_submitted(self, message: Input.Submitted) -> None:
         if message.input.id == "subject":
             self.query_one("#text").focus()
         if message.input.id == "text":
             self.query_one("#recipient").focus()
+        if message.input.id == "attachment":
+            self.send_button_pressed()
+        # the recipient is chosen after the text, the handler of the client form would send the message without it
+        message.prevent_default()
 
     def compose(self) -> ComposeResult:
         yield Label("Subject:")
@@ -64,6 +78,10 @@ class ServerTextMessageInput(TextMessageInput):
         yield Input(id="text")
         yield Label("Recipient:")
         yield Select(id="recipient", options=[(USERS[user].name, user) for user in USERS])
+        yield Label("Priority (used when the message has to wait for a following dispatch):")
+        yield Select(id="priority", options=PRIORITIES, value=0, allow_blank=False)
+        yield Label("Attachment (optional):")
+        yield Input(id="attachment", placeholder="Path of a file sent in chunks over the following dispatches")
         with Horizontal():
             yield Button(label="Send", variant="success", id="send")
             yield Button(label="Cancel", variant="error", id="cancel")
@@ -74,6 +92,8 @@ class ServerApp(BaseApp):
     client = None
     address = None
     s = None
+    outgoing_direction = FROM_EARTH
+    session_log = SERVER_SESSION_LOG
 
     def on_mount(self):
         logging.basicConfig(filename=SERVER_LOG, encoding="utf-8", level=logging.DEBUG,
@@ -87,8 +107,15 @@ class ServerApp(BaseApp):
         self.s.listen(5)
         self.peer, self.address = self.s.accept()
         self.logger.info(f"Client connected from address {self.address}")
+        self.exchange_hello()
+        self.reconcile_history()
+
+        self.fill_dispatch_display_from_queue(self.query_screen_child(ServerMainDisplay).get_last_dispatch_display())
+        self.backup()
+        self.query_screen_child(Countdown).start(SECONDS_BETWEEN_DISPATCHES)
 
-        self.query_one(Countdown).start(SECONDS_BETWEEN_DISPATCHES)
+    def synchronize_history(self, synchronizer: HistorySynchronizer) -> list[tuple[Dispatch, bool]]:
+        return synchronizer.respond()
 
     def handle_encryption(self, received_dispatch: Dispatch) -> None:
         received_dispatch.decrypt_all_messages()
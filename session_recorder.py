@@ -0,0 +1,76 @@
+import copy
+import gzip
+import json
+import os
+import time
+from datetime import datetime
+
+from data_structures import Dispatch, TextMessage
+
+
+def stored_text(text_message: TextMessage) -> tuple[str, bool]:
+    """Text as the message is kept on disk, encrypted when the sender or recipient has encryption on"""
+    stored_message = copy.copy(text_message)
+    if stored_message.sender.encryption_on or stored_message.recipient.encryption_on:
+        stored_message.encrypt()
+    return stored_message.text, stored_message.is_encrypted
+
+
+def recorded_plain_text(text: str, is_encrypted: bool) -> str:
+    text_message = TextMessage(None, None, "", text, "")
+    text_message.is_encrypted = is_encrypted
+    return text_message.plain_text
+
+
+def compact_text_message(text_message: TextMessage) -> list:
+    return [text_message.sender.user_id, text_message.recipient.user_id, text_message.subject,
+            *stored_text(text_message), text_message.time_added]
+
+
+def session_path(log: str, started: datetime) -> str:
+    """client_session.jsonl.gz becomes client_session-20261019-101500.jsonl.gz"""
+    directory, name = os.path.split(log)
+    stem, extension = name.split(".", 1)
+    return os.path.join(directory, f"{stem}-{started:%Y%m%d-%H%M%S}.{extension}")
+
+
+class SessionRecorder:
+    """Write inputs and exchanged dispatches of a session to a gzipped JSON lines log of its own.
+
+    The apps are usually killed rather than closed, so every session gets a new file and every event is flushed.
+    A session that ended by a crash is readable up to its last event and cannot spoil the following ones.
+    """
+
+    def __init__(self, log: str, role: str) -> None:
+        self.path = session_path(log, datetime.now())
+        self.log = gzip.open(self.path, "wt", encoding="utf-8")
+        self.start = time.monotonic()
+        self.record("session_start", role=role)
+
+    def record(self, event_type: str, **fields) -> None:
+        event = {"t": round(time.monotonic() - self.start, 3), "type": event_type, **fields}
+        self.log.write(json.dumps(event, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self.log.flush()
+
+    def record_dispatch(self, event_type: str, dispatch: Dispatch) -> None:
+        self.record(event_type, sequence_number=dispatch.sequence_number,
+                    messages=[compact_text_message(text_message) for text_message in dispatch.text_messages])
+
+    def close(self) -> None:
+        self.log.close()
+
+
+def read_session(path: str) -> list[dict]:
+    events = []
+    with gzip.open(path, "rt", encoding="utf-8") as log:
+        try:
+            for line in log:
+                try:
+                    events.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # the last line of a session that ended by a crash may be cut off
+                    continue
+        except EOFError:
+            # so is the end of the gzip stream
+            pass
+    return events
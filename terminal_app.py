@@ -0,0 +1,144 @@
+import os
+import pickle
+import socket
+import threading
+
+from textual.app import ComposeResult
+from textual.widgets import Header, Footer
+from textual_countdown import Countdown
+
+from client_app import ClientApp, ClientMainDisplay
+from constants import BROKER_SOCKET, TERMINAL_LOG
+from data_structures import TextMessage, Dispatch
+from protocol import send_frame, receive_frame
+from users import USERS
+from user_interface import UserInfoDisplay, TimeDisplay
+
+
+class TerminalTimeDisplay(TimeDisplay):
+
+    def tick(self) -> None:
+        # the broker decides when the window comes, the terminal only counts down to it
+        if self.time_left > 0:
+            self.time_left -= 1
+
+
+class TerminalMainDisplay(ClientMainDisplay):
+    """History of the broker, the broker keeps the backup"""
+
+    def load_snapshot(self, history: list[tuple[Dispatch, bool]], open_dispatch: Dispatch) -> None:
+        open_dispatch_display = self.get_last_dispatch_display()
+        for dispatch, is_received in history:
+            dispatch_display = self.create_dispatch_display(dispatch, is_received)
+            self.dispatch_displays.insert(-1, dispatch_display)
+            self.mount(dispatch_display, before=open_dispatch_display)
+            self.index_dispatch_display(dispatch_display)
+        for text_message in open_dispatch.text_messages:
+            open_dispatch_display.add_new_text_message(text_message)
+
+    def backup(self):
+        pass
+
+    def restore_from_backup(self) -> Dispatch:
+        return Dispatch()
+
+
+class TerminalApp(ClientApp):
+    """Client of the outpost broker, several terminals share the dispatch the broker sends to the Earth"""
+
+    log_file = TERMINAL_LOG
+
+    def __init__(self, socket_path: str = BROKER_SOCKET):
+        super().__init__()
+        self.socket_path = socket_path
+        self.peer = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    def set_up_exchange(self) -> None:
+        # the broker compresses, queues, keeps the attachments and records the exchange for all terminals
+        self.session_recorder = None
+
+    def connect_to_peer(self) -> None:
+        self.peer.connect(self.socket_path)
+        self.logger.debug(f"Connected to the outpost broker on {self.socket_path}")
+        snapshot = pickle.loads(receive_frame(self.peer))
+        self.query_screen_child(TerminalMainDisplay).load_snapshot(snapshot["history"], snapshot["open_dispatch"])
+        self.restart_countdown(snapshot["seconds_left"])
+        threading.Thread(target=self.receive_updates, daemon=True).start()
+
+    def send_request(self, request: dict) -> None:
+        try:
+            send_frame(self.peer, pickle.dumps(request))
+        except OSError as error:
+            self.notify(title="Connection error",
+                        message="The request cannot be sent to the broker. Inform administrator about the problem",
+                        severity="error", timeout=30.0)
+            self.logger.error(f"Request couldn't be sent to the broker because of the following error: {error}")
+
+    def receive_updates(self) -> None:
+        while (frame := receive_frame(self.peer)) is not None:
+            self.call_from_thread(self.apply_update, pickle.loads(frame))
+
+    def restart_countdown(self, seconds_left: int) -> None:
+        self.query_screen_child(TerminalTimeDisplay).time_left = seconds_left
+        self.query_screen_child(Countdown).cancel()
+        self.query_screen_child(Countdown).start(seconds_left)
+
+    def apply_update(self, update: dict) -> None:
+        main_display = self.query_screen_child(TerminalMainDisplay)
+        if update["type"] == "message_added":
+            self.handle_text_message_encryption(update["text_message"])
+            main_display.get_last_dispatch_display().add_new_text_message(update["text_message"])
+        elif update["type"] == "dispatch_sent":
+            main_display.get_last_dispatch_display().dispatch.sequence_number = update["sequence_number"]
+            main_display.add_dispatch_display(self.create_dispatch_display(Dispatch(), received=False))
+            self.restart_countdown(update["seconds_left"])
+            self.notify(message="The dispatch has been successfully sent.", severity="information", timeout=5.0)
+        elif update["type"] == "dispatch_received":
+            self.handle_encryption(update["dispatch"])
+            main_display.merge_history([(update["dispatch"], True)])
+            self.bell()
+            self.notify(title="New dispatch", message="You have received a new dispatch.", severity="information",
+                        timeout=5.0)
+        elif update["type"] == "submitted" and update["queued"]:
+            self.notify(title="Message queued",
+                        message=f"The message will be sent in one of the following dispatches. "
+                                f"Messages waiting: {update['messages_waiting']}",
+                        severity="warning", timeout=5.0)
+        elif update["type"] == "submitted":
+            self.notify(title="Message added", message="Message was successfully added to the dispatch",
+                        severity="information", timeout=5.0)
+        elif update["type"] == "attachment_received":
+            self.notify(title="Attachment received", message=f"The attachment was stored in {update['path']}",
+                        severity="information", timeout=10.0)
+        elif update["type"] == "error":
+            self.notify(title=update["title"], message=update["message"], severity="error", timeout=10.0)
+
+    def handle_login(self):
+        super().handle_login()
+        if self.current_user != USERS["no_account"]:
+            self.send_request({"type": "login", "user_id": self.current_user.user_id})
+
+    def action_log_out(self) -> None:
+        past_user = self.current_user
+        super().action_log_out()
+        if past_user != USERS["no_account"]:
+            self.send_request({"type": "logout"})
+
+    def submit_text_message(self, text_message: TextMessage, priority: int, attachment_path: str | None = None) -> None:
+        # the broker checks the limits and answers with an update, the message itself comes as message_added
+        self.send_request({"type": "submit", "subject": text_message.subject, "text": text_message.plain_text,
+                           "priority": priority,
+                           "attachment_path": os.path.abspath(attachment_path) if attachment_path else None})
+
+    def compose(self) -> ComposeResult:
+        yield Header(show_clock=True)
+        yield Footer()
+        yield UserInfoDisplay()
+        yield TerminalTimeDisplay()
+        yield Countdown()
+        yield TerminalMainDisplay()
+
+
+if __name__ == "__main__":
+    app = TerminalApp()
+    app.run()
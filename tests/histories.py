@@ -0,0 +1,21 @@
+import random
+
+from constants import MAX_MESSAGES_IN_DISPATCH
+from data_structures import Dispatch, TextMessage
+from users import USERS
+
+
+def generate_history(windows: int, rng: random.Random) -> list[tuple[Dispatch, bool]]:
+    """Sent and received dispatch of every window, each with at least one message"""
+    users = list(USERS.values())[1:]
+    history = []
+    for sequence_number in range(windows):
+        for is_received in (False, True):
+            dispatch = Dispatch()
+            for index in range(rng.randrange(1, MAX_MESSAGES_IN_DISPATCH + 1)):
+                dispatch.add_new_text_messages(TextMessage(rng.choice(users), rng.choice(users),
+                                                           f"Subject {sequence_number}/{index}",
+                                                           f"Text of message {rng.getrandbits(64):x}", "12:00:00"))
+            dispatch.sequence_number = sequence_number
+            history.append((dispatch, is_received))
+    return history
@@ -0,0 +1,131 @@
+import asyncio
+import os
+import pickle
+import random
+
+from textual.app import App, ComposeResult
+
+from attachments import AttachmentTransfer, file_sha256, to_ranges, from_ranges
+from constants import ATTACHMENT_CHUNK_SIZE
+from data_structures import Dispatch, TextMessage
+from server_app import ServerTextMessageInput
+from user_interface import TextMessageInput
+from users import USERS
+
+CHUNK_COUNT = 20
+
+
+def dispatch_with_one_free_slot() -> Dispatch:
+    # one free message slot leaves room for a few chunks, so the file takes several windows
+    return Dispatch(*(TextMessage(USERS["andy_stein"], USERS["earth"], f"Report {index}", "text", "12:00:00")
+                      for index in range(Dispatch.max_text_messages - 1)))
+
+
+def transfer(tmp_path, lose: set[int] = frozenset(), restart_at: int | None = None, damage: set[int] = frozenset()):
+    """Send a file from the outpost to the Earth, returns the completed paths and the chunks sent"""
+    path = tmp_path / "report.bin"
+    path.write_bytes(random.Random(0).randbytes(CHUNK_COUNT * ATTACHMENT_CHUNK_SIZE - 100))
+    sender = AttachmentTransfer(str(tmp_path / "sent"), str(tmp_path / "sender.pkl"))
+    receiver_arguments = (str(tmp_path / "received"), str(tmp_path / "receiver.pkl"))
+    receiver = AttachmentTransfer(*receiver_arguments)
+    attachment = sender.attach(str(path))
+
+    completed_paths = []
+    chunks_sent = 0
+    window = 0
+    while sender.outgoing:
+        window += 1
+        assert window < 50
+        if window == restart_at:
+            receiver = AttachmentTransfer(*receiver_arguments)
+        outpost_dispatch = pickle.loads(sender.pack(dispatch_with_one_free_slot()))
+        chunks_sent += len(outpost_dispatch.attachment_chunks)
+        if window in damage:
+            for chunk in outpost_dispatch.attachment_chunks:
+                chunk.data = bytes(len(chunk.data))
+        if window not in lose:
+            completed_paths += receiver.unpack(outpost_dispatch)
+        sender.unpack(pickle.loads(receiver.pack(Dispatch())))
+
+    assert [file_sha256(completed_path) for completed_path in completed_paths] == [attachment.sha256]
+    assert not os.path.exists(receiver.part_path(attachment))
+    return completed_paths, chunks_sent
+
+
+def test_ranges_round_trip():
+    assert to_ranges({0, 1, 2, 5, 7, 8}) == [(0, 3), (5, 6), (7, 9)]
+    assert from_ranges(to_ranges({0, 1, 2, 5, 7, 8})) == {0, 1, 2, 5, 7, 8}
+
+
+def test_file_arrives_whole(tmp_path):
+    completed_paths, chunks_sent = transfer(tmp_path)
+    assert os.path.basename(completed_paths[0]) == "report.bin"
+    assert chunks_sent == CHUNK_COUNT
+
+
+def test_chunks_of_a_lost_dispatch_are_sent_again(tmp_path):
+    _, chunks_sent = transfer(tmp_path, lose={2})
+    assert chunks_sent > CHUNK_COUNT
+
+
+def test_damaged_chunks_are_sent_again(tmp_path):
+    _, chunks_sent = transfer(tmp_path, damage={1})
+    assert chunks_sent > CHUNK_COUNT
+
+
+def test_restarted_receiver_resumes_without_resending(tmp_path):
+    _, chunks_sent = transfer(tmp_path, restart_at=2)
+    assert chunks_sent == CHUNK_COUNT
+
+
+def test_pack_and_unpack_leave_only_the_messages(tmp_path):
+    path = tmp_path / "note.txt"
+    path.write_bytes(b"note")
+    sender = AttachmentTransfer(str(tmp_path / "sent"), str(tmp_path / "sender.pkl"))
+    sender.attach(str(path))
+    dispatch = Dispatch()
+    packed = pickle.loads(sender.pack(dispatch))
+    assert dispatch.attachment_chunks == () and len(packed.attachment_chunks) == 1
+
+    receiver = AttachmentTransfer(str(tmp_path / "received"), str(tmp_path / "receiver.pkl"))
+    assert receiver.unpack(packed) == [str(tmp_path / "received" / "note.txt")]
+    assert packed.attachment_chunks == () and packed.attachment_acknowledgements == ()
+
+
+class ServerFormApp(App):
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.submitted: list[TextMessageInput.TextMessageSubmitted] = []
+
+    def compose(self) -> ComposeResult:
+        yield ServerTextMessageInput()
+
+    def on_text_message_input_text_message_submitted(self, message: TextMessageInput.TextMessageSubmitted) -> None:
+        self.submitted.append(message)
+
+
+async def press_enter_in_server_form(input_id: str) -> tuple[list[TextMessageInput.TextMessageSubmitted], str]:
+    app = ServerFormApp()
+    async with app.run_test() as pilot:
+        form = app.query_one(ServerTextMessageInput)
+        form.query_one("#subject").value = "Orders"
+        form.query_one("#text").value = "text"
+        form.query_one("#recipient").value = "olga_kovalenko"
+        form.query_one("#attachment").value = "morse.mp3"
+        form.query_one(f"#{input_id}").focus()
+        await pilot.press("enter")
+        await pilot.pause()
+        return app.submitted, app.focused.id
+
+
+def test_enter_in_the_attachment_of_the_server_form_sends_the_message():
+    submitted, _ = asyncio.run(press_enter_in_server_form("attachment"))
+    assert [(message.recipient, message.attachment_path) for message in submitted] == [
+        ("olga_kovalenko", "morse.mp3")]
+
+
+def test_enter_in_the_text_of_the_server_form_moves_to_the_recipient():
+    submitted, focused_id = asyncio.run(press_enter_in_server_form("text"))
+    assert submitted == []
+    assert focused_id == "recipient"
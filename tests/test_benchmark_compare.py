@@ -0,0 +1,30 @@
+from benchmarks.suite import compare
+
+
+def results(**times: tuple[float, float]) -> dict:
+    return {"results": {name: {"median": (fastest + slowest) / 2, "min": fastest, "max": slowest, "repeats": 7}
+                        for name, (fastest, slowest) in times.items()}}
+
+
+def test_slowdown_beyond_the_threshold_is_flagged():
+    baseline = results(exchange=(1.0, 1.1), search=(2.0, 2.1))
+    current = results(exchange=(1.3, 1.4), search=(2.1, 2.2))
+    assert compare(baseline, current, 0.25) == ["exchange"]
+
+
+def test_noisy_baseline_does_not_hide_a_regression():
+    baseline = results(decode_card_id=(1.0, 2.0))
+    current = results(decode_card_id=(1.48, 1.5))
+    assert compare(baseline, current, 0.25) == ["decode_card_id"]
+
+
+def test_slower_samples_other_than_the_fastest_are_not_a_regression():
+    baseline = results(backup=(1.0, 1.1))
+    current = results(backup=(1.1, 3.0))
+    assert compare(baseline, current, 0.25) == []
+
+
+def test_new_and_missing_benchmarks_are_not_regressions(capsys):
+    assert compare(results(old=(1.0, 1.0)), results(new=(5.0, 5.0)), 0.25) == []
+    output = capsys.readouterr().out
+    assert "new" in output and "missing in current results" in output
@@ -0,0 +1,44 @@
+import pickle
+import random
+
+from compression import PayloadCompressor, train_dictionary, CODEC_NONE, CODEC_ZLIB_DICTIONARY
+from data_structures import Dispatch, TextMessage
+from users import USERS
+
+
+def sample_payloads(count: int) -> list[bytes]:
+    rng = random.Random(count)
+    payloads = []
+    for index in range(count):
+        dispatch = Dispatch(TextMessage(USERS["andy_stein"], USERS["earth"], f"Report {index}",
+                                        f"Status of the outpost {rng.getrandbits(64):x}", "12:00:00"))
+        payloads.append(pickle.dumps(dispatch))
+    return payloads
+
+
+def test_round_trip_with_every_codec():
+    dictionary = train_dictionary(sample_payloads(50))
+    compressor = PayloadCompressor(dictionary)
+    data = sample_payloads(1)[0] * 20
+    for codec in compressor.codecs:
+        payload = bytes([codec]) + compressor.compress_with(codec, data)
+        assert compressor.decompress(payload) == data
+    assert compressor.decompress(compressor.compress(data)) == data
+
+
+def test_incompressible_data_goes_uncompressed():
+    data = random.Random(0).randbytes(4096)
+    payload = PayloadCompressor().compress(data)
+    assert payload[0] == CODEC_NONE
+    assert PayloadCompressor().decompress(payload) == data
+
+
+def test_dictionary_is_dropped_when_the_peer_has_another_one():
+    compressor = PayloadCompressor(train_dictionary(sample_payloads(50)))
+    peer = PayloadCompressor(train_dictionary(sample_payloads(60)))
+    compressor.negotiate(peer.hello())
+    assert CODEC_ZLIB_DICTIONARY not in compressor.codecs
+
+    same = PayloadCompressor(compressor.dictionary)
+    same.negotiate(PayloadCompressor(compressor.dictionary).hello())
+    assert CODEC_ZLIB_DICTIONARY in same.codecs
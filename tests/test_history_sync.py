@@ -0,0 +1,87 @@
+import copy
+import pickle
+import random
+import socket
+import threading
+
+from data_structures import TextMessage
+from history_sync import SyncHistory, HistorySynchronizer, TO_EARTH, FROM_EARTH, dispatch_digest
+from histories import generate_history
+from protocol import send_frame, receive_frame
+from users import USERS
+
+
+def channel(sock: socket.socket):
+    return (lambda message: send_frame(sock, pickle.dumps(message)),
+            lambda: pickle.loads(receive_frame(sock)))
+
+
+def reconcile(client_history: list, server_history: list) -> tuple[list, list]:
+    """Dispatches the client and the server received when they synchronized over a socket pair"""
+    client_socket, server_socket = socket.socketpair()
+    results = {}
+
+    def respond():
+        server = HistorySynchronizer(SyncHistory(server_history, FROM_EARTH), *channel(server_socket))
+        results["server"] = server.respond()
+
+    thread = threading.Thread(target=respond)
+    thread.start()
+    client = HistorySynchronizer(SyncHistory(client_history, TO_EARTH), *channel(client_socket))
+    results["client"] = client.initiate()
+    thread.join()
+    client_socket.close()
+    server_socket.close()
+    return results["client"], results["server"]
+
+
+def mirrored(history: list) -> list:
+    # what the client sent the server received and the other way round
+    return [(copy.deepcopy(dispatch), not is_received) for dispatch, is_received in history]
+
+
+def digests(history: list) -> dict:
+    return {(dispatch.sequence_number, is_received): dispatch_digest(dispatch) for dispatch, is_received in history}
+
+
+def apply(history: list, received: list) -> list:
+    merged = {(dispatch.sequence_number, is_received): (dispatch, is_received) for dispatch, is_received in history}
+    merged.update({(dispatch.sequence_number, is_received): (dispatch, is_received)
+                   for dispatch, is_received in received})
+    return list(merged.values())
+
+
+def test_equal_histories_exchange_nothing():
+    history = generate_history(300, random.Random(1))
+    assert reconcile(history, mirrored(history)) == ([], [])
+
+
+def test_missing_dispatches_are_exchanged_both_ways():
+    history = generate_history(300, random.Random(2))
+    # a dispatch missing on both sides could not be restored by anybody
+    client_history = [entry for index, entry in enumerate(history) if index % 7 != 0]
+    server_history = [entry for index, entry in enumerate(mirrored(history)) if index % 7 != 3]
+
+    client_received, server_received = reconcile(client_history, server_history)
+    assert digests(apply(client_history, client_received)) == digests(history)
+    assert digests(apply(server_history, server_received)) == digests(mirrored(history))
+
+
+def test_sender_of_a_dispatch_wins_a_conflict():
+    history = generate_history(20, random.Random(3))
+    server_history = mirrored(history)
+    client_dispatch = next(dispatch for dispatch, is_received in history
+                           if dispatch.sequence_number == 5 and not is_received)
+    server_dispatch = next(dispatch for dispatch, is_received in server_history
+                           if dispatch.sequence_number == 5 and not is_received)
+    client_dispatch.text_messages[0] = TextMessage(USERS["andy_stein"], USERS["earth"], "Changed", "By the client",
+                                                   "12:00:00")
+    server_dispatch.text_messages[0] = TextMessage(USERS["earth"], USERS["andy_stein"], "Changed", "By the server",
+                                                   "12:00:00")
+
+    client_received, server_received = reconcile(history, server_history)
+    # the client sent dispatch 5, the server received it, the server sent the other dispatch 5
+    assert [(dispatch.sequence_number, is_received) for dispatch, is_received in client_received] == [(5, True)]
+    assert client_received[0][0].text_messages[0].text == "By the server"
+    assert [(dispatch.sequence_number, is_received) for dispatch, is_received in server_received] == [(5, True)]
+    assert server_received[0][0].text_messages[0].text == "By the client"
@@ -0,0 +1,105 @@
+import asyncio
+
+from textual.app import App, ComposeResult
+
+from data_structures import Dispatch, TextMessage
+from outbound_queue import OutboundScheduler
+from outpost_broker import OutpostBroker
+from user_interface import MainDisplay
+from users import USERS
+
+
+def message(user_key: str, subject: str) -> TextMessage:
+    return TextMessage(USERS[user_key], USERS["earth"], subject, "text", "12:00:00")
+
+
+def pop_all(scheduler: OutboundScheduler, dispatch: Dispatch) -> list[str]:
+    subjects = []
+    while (text_message := scheduler.pop_next(dispatch)) is not None:
+        dispatch.add_new_text_messages(text_message)
+        subjects.append(text_message.subject)
+    return subjects
+
+
+def test_higher_priority_goes_first(tmp_path):
+    scheduler = OutboundScheduler(str(tmp_path / "queue.pkl"))
+    scheduler.enqueue(message("mica_creeve", "normal"), 0)
+    scheduler.enqueue(message("mica_creeve", "urgent"), 2)
+    scheduler.enqueue(message("mica_creeve", "high"), 1)
+    assert pop_all(scheduler, Dispatch()) == ["urgent", "high", "normal"]
+
+
+def test_sender_limit_holds_and_the_rest_waits(tmp_path):
+    scheduler = OutboundScheduler(str(tmp_path / "queue.pkl"))
+    for index in range(3):
+        scheduler.enqueue(message("andy_stein", f"andy {index}"))
+    assert pop_all(scheduler, Dispatch()) == ["andy 0", "andy 1"]
+    assert len(scheduler) == 1
+    assert pop_all(scheduler, Dispatch()) == ["andy 2"]
+
+
+def test_ties_go_to_the_sender_with_fewer_messages_in_the_dispatch(tmp_path):
+    scheduler = OutboundScheduler(str(tmp_path / "queue.pkl"))
+    for index in range(4):
+        scheduler.enqueue(message("mica_creeve", f"mica {index}"))
+    scheduler.enqueue(message("andy_stein", "andy 0"))
+    scheduler.enqueue(message("andy_stein", "andy 1"))
+    assert pop_all(scheduler, Dispatch()) == ["mica 0", "andy 0", "mica 1", "andy 1", "mica 2"]
+
+
+def test_queue_is_kept_only_once_saved(tmp_path):
+    queue_file = str(tmp_path / "queue.pkl")
+    scheduler = OutboundScheduler(queue_file)
+    scheduler.enqueue(message("andy_stein", "first"))
+    scheduler.enqueue(message("igor_petkevic", "second"))
+    assert pop_all(scheduler, Dispatch()) == ["first", "second"]
+
+    # popped messages stay in the file until the caller backed up the dispatch and saved the queue
+    assert len(OutboundScheduler(queue_file)) == 2
+    scheduler.save()
+    assert len(OutboundScheduler(queue_file)) == 0
+
+
+def test_broker_restarted_after_filling_sends_the_queued_messages(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    broker = OutpostBroker(str(tmp_path / "broker.sock"))
+    broker.outbound_scheduler.enqueue(message("andy_stein", "queued"))
+    broker.fill_open_dispatch_from_queue()
+
+    restarted = OutpostBroker(str(tmp_path / "broker.sock"))
+    assert [text_message.subject for text_message in restarted.open_dispatch.text_messages] == ["queued"]
+    assert restarted.history == []
+    assert len(restarted.outbound_scheduler) == 0
+
+
+class MainDisplayApp(App):
+
+    def compose(self) -> ComposeResult:
+        yield MainDisplay()
+
+
+async def fill_from_queue(scheduler: OutboundScheduler) -> None:
+    app = MainDisplayApp()
+    async with app.run_test():
+        main_display = app.query_one(MainDisplay)
+        main_display.get_last_dispatch_display().add_new_text_message(scheduler.pop_next(Dispatch()))
+        main_display.backup()
+        scheduler.save()
+
+
+async def restart_main_display() -> tuple[list, list[str]]:
+    app = MainDisplayApp()
+    async with app.run_test():
+        main_display = app.query_one(MainDisplay)
+        return (main_display.get_history(),
+                [text_message.subject for text_message in main_display.get_last_dispatch_display().dispatch.text_messages])
+
+
+def test_main_display_restarted_after_filling_sends_the_queued_messages(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    scheduler = OutboundScheduler()
+    scheduler.enqueue(message("andy_stein", "queued"))
+    asyncio.run(fill_from_queue(scheduler))
+
+    assert asyncio.run(restart_main_display()) == ([], ["queued"])
+    assert len(OutboundScheduler()) == 0
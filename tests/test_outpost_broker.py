@@ -0,0 +1,102 @@
+import pickle
+import socket
+import threading
+
+import pytest
+
+import app
+from data_structures import Dispatch, TextMessage
+from outbound_queue import OutboundScheduler
+from outpost_broker import OutpostBroker, TerminalSession
+from protocol import receive_frame
+from terminal_app import TerminalApp
+from users import USERS
+
+
+def connect_terminal(broker: OutpostBroker, user_key: str) -> socket.socket:
+    broker_side, terminal_side = socket.socketpair()
+    terminal = TerminalSession(broker_side)
+    terminal.user = USERS[user_key]
+    broker.terminals.append(terminal)
+    return terminal_side
+
+
+def submit(broker: OutpostBroker, terminal_index: int, subject: str) -> None:
+    broker.submit_text_message(broker.terminals[terminal_index], {"type": "submit", "subject": subject,
+                                                                  "text": "text", "priority": 0,
+                                                                  "attachment_path": None})
+
+
+def receive_update(connection: socket.socket) -> dict:
+    return pickle.loads(receive_frame(connection))
+
+
+def test_limit_of_a_user_holds_across_terminals(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    broker = OutpostBroker()
+    first = connect_terminal(broker, "tim_coreway")
+    second = connect_terminal(broker, "tim_coreway")
+    submit(broker, 0, "first")
+    submit(broker, 1, "second")
+
+    assert [text_message.subject for text_message in broker.open_dispatch.text_messages] == ["first"]
+    assert len(broker.outbound_scheduler) == 1
+    assert receive_update(first)["type"] == "message_added"
+    assert receive_update(first) == {"type": "submitted", "queued": False}
+    assert receive_update(second)["type"] == "message_added"
+    assert receive_update(second) == {"type": "submitted", "queued": True, "messages_waiting": 1}
+
+
+def test_terminals_get_only_the_added_message(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    broker = OutpostBroker()
+    writing = connect_terminal(broker, "mica_creeve")
+    watching = connect_terminal(broker, "no_account")
+    submit(broker, 0, "report")
+
+    update = receive_update(watching)
+    assert update["type"] == "message_added"
+    assert update["text_message"].subject == "report"
+    assert receive_update(writing)["text_message"].subject == "report"
+    # the answer to the submission goes only to the terminal that wrote it
+    assert receive_update(writing)["type"] == "submitted"
+    watching.setblocking(False)
+    with pytest.raises(BlockingIOError):
+        watching.recv(1)
+
+
+def test_connected_terminal_gets_the_history_and_the_open_dispatch(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    broker = OutpostBroker()
+    sent = Dispatch(TextMessage(USERS["andy_stein"], USERS["earth"], "sent", "text", "12:00:00"))
+    sent.sequence_number = 0
+    broker.history = [(sent, False), (Dispatch(), True)]
+    broker.open_dispatch = Dispatch(TextMessage(USERS["mica_creeve"], USERS["earth"], "open", "text", "12:10:00"))
+
+    broker_side, terminal_side = socket.socketpair()
+    serving = threading.Thread(target=broker.serve_terminal, args=(broker_side,))
+    serving.start()
+    snapshot = receive_update(terminal_side)
+    terminal_side.close()
+    serving.join()
+
+    assert snapshot["type"] == "snapshot"
+    assert [(dispatch.sequence_number, is_received) for dispatch, is_received in snapshot["history"]] == [
+        (0, False), (None, True)]
+    assert [text_message.subject for text_message in snapshot["open_dispatch"].text_messages] == ["open"]
+    assert broker.terminals == []
+
+
+def test_terminal_leaves_the_queue_and_the_session_log_to_the_broker(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(app, "RECORD_SESSIONS", True)
+    queue = OutboundScheduler()
+    queue.enqueue(TextMessage(USERS["andy_stein"], USERS["earth"], "queued", "text", "12:00:00"))
+    queue.save()
+    files = sorted(path.name for path in tmp_path.iterdir())
+
+    terminal = TerminalApp(str(tmp_path / "broker.sock"))
+    assert terminal.log_file == "terminal.log"
+    assert terminal.session_recorder is None
+    assert not hasattr(terminal, "outbound_scheduler")
+    assert sorted(path.name for path in tmp_path.iterdir()) == files
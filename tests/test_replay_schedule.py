@@ -0,0 +1,61 @@
+from data_structures import TextMessage
+from replay_session import build_schedules
+from session_recorder import stored_text
+from users import USERS
+
+OLGA = USERS["olga_kovalenko"].user_id
+EARTH = USERS["earth"].user_id
+
+
+def exchange(t: float, sent: int, received: int, messages: list | None = None) -> list[dict]:
+    return [{"t": t, "type": "dispatch_sent", "sequence_number": sent, "messages": []},
+            {"t": t, "type": "dispatch_received", "sequence_number": received, "messages": messages or []}]
+
+
+def submitted(t: float, sender: int, recipient: int, subject: str) -> dict:
+    return {"t": t, "type": "message_submitted", "sender": sender, "recipient": recipient, "subject": subject,
+            "text": "text", "is_encrypted": False, "priority": 0}
+
+
+def client_log() -> list[dict]:
+    return [{"t": 0.0, "type": "session_start", "role": "ClientApp"}, {"t": 1.0, "type": "login", "user_id": OLGA},
+            submitted(5.0, OLGA, EARTH, "client"), *exchange(10.0, 3, 3), *exchange(20.0, 4, 4)]
+
+
+def test_server_log_is_moved_onto_the_clock_of_the_client():
+    # the server was started 100 s before the client and its log already holds an exchange the client's does not
+    server_events = [{"t": 0.0, "type": "session_start", "role": "ServerApp"}, *exchange(100.0, 2, 2),
+                     submitted(105.0, EARTH, OLGA, "server"), *exchange(110.0, 3, 3), *exchange(120.0, 4, 4)]
+    client_inputs, server_inputs, windows = build_schedules(client_log(), server_events, None)
+    assert windows == [10.0, 20.0]
+    assert [event["t"] for event in client_inputs] == [1.0, 5.0]
+    assert [(event["t"], event["subject"]) for event in server_inputs] == [(5.0, "server")]
+
+
+def test_logs_without_a_shared_dispatch_are_aligned_on_their_first_sent_dispatch():
+    server_events = [{"t": 0.0, "type": "session_start", "role": "ServerApp"},
+                     submitted(32.0, EARTH, OLGA, "server"), *exchange(40.0, 0, 0), *exchange(50.0, 1, 1)]
+    _, server_inputs, _ = build_schedules(client_log(), server_events, None)
+    assert [event["t"] for event in server_inputs] == [2.0]
+
+
+def test_inputs_of_the_side_without_a_log_come_from_the_dispatches_it_sent():
+    text_message = TextMessage(USERS["earth"], USERS["olga_kovalenko"], "Orders", "plain text", "12:00:00")
+    messages = [[EARTH, OLGA, "Orders", *stored_text(text_message), "12:00:00"]]
+    client_events = [*exchange(10.0, 0, 0), *exchange(20.0, 1, 1, messages), *exchange(30.0, 2, 2)]
+    client_inputs, server_inputs, windows = build_schedules(client_events, None, 2)
+    assert windows == [10.0, 20.0]
+    assert client_inputs == []
+    # submitted before the window it came with, in plain text as the replayed input types it
+    assert [(event["t"], event["subject"], event["text"]) for event in server_inputs] == [(10.0, "Orders",
+                                                                                          "plain text")]
+
+
+def test_encrypted_texts_are_replayed_in_plain():
+    text_message = TextMessage(USERS["olga_kovalenko"], USERS["earth"], "Report", "plain text", "12:00:00")
+    text, is_encrypted = stored_text(text_message)
+    client_events = [{**submitted(5.0, OLGA, EARTH, "Report"), "text": text, "is_encrypted": is_encrypted},
+                     *exchange(10.0, 0, 0)]
+    client_inputs, _, _ = build_schedules(client_events, None, None)
+    assert is_encrypted
+    assert [(event["text"], event["is_encrypted"]) for event in client_inputs] == [("plain text", False)]
@@ -0,0 +1,47 @@
+from search_index import SearchIndex, tokenize
+
+
+def build_index(texts: list[str]) -> SearchIndex:
+    index = SearchIndex()
+    for document_id, text in enumerate(texts):
+        index.add(document_id, text)
+    return index
+
+
+def test_tokens_are_folded():
+    assert tokenize("Hlášení ze ZÁKLADNY") == ["hlaseni", "ze", "zakladny"]
+
+
+def test_words_and_prefix_of_the_last_one_match_newest_first():
+    index = build_index(["water supply low", "water pump fixed", "supply drop tomorrow", "Water supplies ok"])
+    assert index.search("water") == [3, 1, 0]
+    assert index.search("water sup") == [3, 0]
+    assert index.search("hlaseni") == []
+    assert index.search("") == []
+
+
+def test_search_finds_text_with_diacritics():
+    index = build_index(["Hlášení o zásobách"])
+    assert index.search("hlaseni zasob") == [0]
+
+
+def test_removed_documents_are_skipped_until_added_again():
+    index = build_index(["radio check", "radio silence", "radio repaired"])
+    index.remove(1)
+    assert index.search("radio") == [2, 0]
+    index.add(1, "radio silence")
+    assert index.search("radio") == [2, 1, 0]
+
+
+def test_out_of_order_ids_keep_the_posting_sorted():
+    index = SearchIndex()
+    index.add(5, "storm warning")
+    index.add(2, "storm passed")
+    assert index.search("storm") == [5, 2]
+    assert index.search("storm", limit=1) == [5]
+
+
+def test_short_prefix_finds_the_newest_of_many_terms():
+    index = build_index([f"ab{number:03}" for number in range(100)])
+    assert index.search("ab", limit=3) == [99, 98, 97]
+    assert len(index.search("ab")) == 100
@@ -0,0 +1,55 @@
+import glob
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from data_structures import Dispatch, TextMessage
+from session_recorder import SessionRecorder, read_session, stored_text, recorded_plain_text
+from users import USERS
+
+
+def record_and_crash(log: str, subject: str) -> None:
+    recorder = SessionRecorder(log, "ClientApp")
+    recorder.record("login", user_id=USERS["olga_kovalenko"].user_id)
+    recorder.record_dispatch("dispatch_sent", Dispatch(
+        TextMessage(USERS["olga_kovalenko"], USERS["earth"], subject, "secret", "12:00:00")))
+    # killed like the apps usually are, the log is never closed
+    os._exit(0)
+
+
+def test_sessions_after_a_crash_stay_readable(tmp_path):
+    log = str(tmp_path / "client_session.jsonl.gz")
+    context = multiprocessing.get_context("fork")
+    for subject in ("first", "second"):
+        process = context.Process(target=record_and_crash, args=(log, subject))
+        process.start()
+        process.join()
+        # the sessions are named after the second they started in
+        time.sleep(1.1)
+
+    paths = sorted(glob.glob(str(tmp_path / "client_session-*.jsonl.gz")))
+    assert len(paths) == 2
+    for path, subject in zip(paths, ("first", "second")):
+        events = read_session(path)
+        assert [event["type"] for event in events] == ["session_start", "login", "dispatch_sent"]
+        assert events[2]["messages"][0][2] == subject
+
+
+def test_cut_off_last_line_is_skipped(tmp_path):
+    recorder = SessionRecorder(str(tmp_path / "server_session.jsonl.gz"), "ServerApp")
+    recorder.record("dispatch_sent", sequence_number=0, messages=[])
+    recorder.log.write('{"t":1.0,"type":"dispa')
+    recorder.close()
+    assert [event["type"] for event in read_session(recorder.path)] == ["session_start", "dispatch_sent"]
+
+
+@pytest.mark.parametrize("sender, encrypted", [("olga_kovalenko", True), ("andy_stein", False)])
+def test_texts_of_encrypted_accounts_are_recorded_encrypted(sender, encrypted):
+    text_message = TextMessage(USERS[sender], USERS["earth"], "Report", "plain text", "12:00:00")
+    text, is_encrypted = stored_text(text_message)
+    assert is_encrypted == encrypted
+    assert (text != "plain text") == encrypted
+    assert recorded_plain_text(text, is_encrypted) == "plain text"
+    assert text_message.text == "plain text" and not text_message.is_encrypted
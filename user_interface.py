@@ -1,4 +1,3 @@
-import pickle
 import os
 
 from textual import events
@@ -9,8 +8,10 @@ from textual.reactive import reactive
 from textual.widget import Widget
 from textual.widgets import Static, Input, Label, Button, Rule
 
-from constants import SECONDS_BETWEEN_DISPATCHES, MESSAGE_MAX_LENGTH, SUBJECT_MAX_LENGTH, BACKUP_FILE
+from constants import SECONDS_BETWEEN_DISPATCHES, MESSAGE_MAX_LENGTH, SUBJECT_MAX_LENGTH
 from data_structures import TextMessage, Dispatch, User
+from history_store import save_backup, load_backup, next_sequence_number, merge_history
+from search_index import SearchIndex
 from users import USERS
 
 
@@ -77,11 +78,17 @@ class TextMessageDisplay(Static):
 
     def __init__(self, text_message: TextMessage) -> None:
         self.text_message = text_message
+        self.text_display: Static | None = None
         super().__init__()
 
     def display_user(self, user: User):
         return f"{user.user_id}"
 
+    def refresh_text(self) -> None:
+        # a display that has not been composed yet shows the current text once it is
+        if self.text_display is not None:
+            self.text_display.update(self.text_message.text)
+
     def compose(self) -> ComposeResult:
         with Horizontal(classes="message_header"):
             with Vertical():
@@ -90,7 +97,10 @@ class TextMessageDisplay(Static):
                 yield Static(f"Subject: {self.text_message.subject}\n")
             yield Static(f"{self.text_message.time_added}", classes="message_time")
         yield Rule()
-        yield Static(self.text_message.text)
+        self.text_display = Static(self.text_message.text)
+        yield self.text_display
+        if self.text_message.attachment is not None:
+            yield Static(f"Attachment: {self.text_message.attachment}", classes="attachment")
 
 
 class DispatchDisplay(Static):
@@ -102,6 +112,14 @@ class DispatchDisplay(Static):
 
     text_message_display_class = TextMessageDisplay
 
+    class TextMessageAdded(Message):
+        """New text message was added to the dispatch"""
+
+        def __init__(self, dispatch_display: "DispatchDisplay", text_message: TextMessage) -> None:
+            self.dispatch_display = dispatch_display
+            self.text_message = text_message
+            super().__init__()
+
     def __init__(self, dispatch: Dispatch, received: bool) -> None:
         self.dispatch = dispatch
         self.is_received = received
@@ -117,6 +135,7 @@ class DispatchDisplay(Static):
             text_message_display = self.text_message_display_class(text_message)
             self.mount(text_message_display)
             text_message_display.scroll_visible()
+            self.post_message(self.TextMessageAdded(self, text_message))
             return True
         else:
             return False
@@ -137,15 +156,61 @@ class MainDisplay(ScrollableContainer):
 
     def __init__(self) -> None:
         self.dispatch_displays: list[DispatchDisplay] = []
+        self.search_index = SearchIndex()
+        # texts readable only by their owner are indexed separately and only while the owner is logged in
+        self.private_search_index: SearchIndex | None = None
+        self.search_owner: User | None = None
+        self.search_documents: dict[int, tuple[DispatchDisplay, TextMessage]] = {}
+        self.documents_of_dispatch_display: dict[int, list[int]] = {}
+        self.next_document_id = 0
         super().__init__()
 
     def on_mount(self, event: events.Mount) -> None:
-        self.restore_from_backup()
-        self.add_dispatch_display(self.dispatch_display_class(Dispatch(), received=False))
+        open_dispatch = self.restore_from_backup()
+        self.add_dispatch_display(self.dispatch_display_class(open_dispatch, received=False))
 
     def get_last_dispatch_display(self) -> DispatchDisplay:
         return self.dispatch_displays[-1]
 
+    def get_history(self) -> list[tuple[Dispatch, bool]]:
+        return [(dispatch_display.dispatch, dispatch_display.is_received)
+                for dispatch_display in self.dispatch_displays[:-1]]
+
+    def next_sequence_number(self) -> int:
+        return next_sequence_number(self.get_history())
+
+    def merge_history(self, dispatches: list[tuple[Dispatch, bool]]) -> None:
+        open_dispatch_display = self.get_last_dispatch_display()
+        displays_by_dispatch = {id(dispatch_display.dispatch): dispatch_display
+                                for dispatch_display in self.dispatch_displays[:-1]}
+        displays_by_key = {(dispatch_display.dispatch.sequence_number, dispatch_display.is_received): dispatch_display
+                           for dispatch_display in self.dispatch_displays[:-1]
+                           if dispatch_display.dispatch.sequence_number is not None}
+        merged_displays = []
+        new_displays = set()
+        for dispatch, is_received in merge_history(self.get_history(), dispatches):
+            if id(dispatch) in displays_by_dispatch:
+                merged_displays.append(displays_by_dispatch[id(dispatch)])
+                continue
+            key = (dispatch.sequence_number, is_received)
+            if key in displays_by_key:
+                dispatch_display = displays_by_key[key]
+                self.unindex_dispatch_display(dispatch_display)
+                dispatch_display.dispatch = dispatch
+                dispatch_display.refresh(recompose=True)
+            else:
+                dispatch_display = self.create_dispatch_display(dispatch, is_received)
+                new_displays.add(id(dispatch_display))
+            self.index_dispatch_display(dispatch_display)
+            merged_displays.append(dispatch_display)
+
+        self.dispatch_displays = merged_displays + [open_dispatch_display]
+        # mount from the end so that the display each new one goes before is already mounted
+        for index in range(len(self.dispatch_displays) - 2, -1, -1):
+            if id(self.dispatch_displays[index]) in new_displays:
+                self.mount(self.dispatch_displays[index], before=self.dispatch_displays[index + 1])
+        self.backup()
+
     def create_dispatch_display(self, dispatch: Dispatch, received: bool) -> DispatchDisplay:
         return self.dispatch_display_class(dispatch, received)
 
@@ -153,28 +218,77 @@ class MainDisplay(ScrollableContainer):
         self.dispatch_displays.append(dispatch_display)
         self.mount(dispatch_display)
         dispatch_display.scroll_visible()
-        self.backup()
+        self.index_dispatch_display(dispatch_display)
 
-    def backup(self):
-        dispatches = []
-        for dispatch_display in self.dispatch_displays:
-            if not dispatch_display.dispatch.text_messages:
-                continue
-            dispatches.append((dispatch_display.dispatch, dispatch_display.is_received))
-        if dispatches:
-            with open(BACKUP_FILE, "wb") as backup:
-                pickle.dump(dispatches, backup)
+    def is_text_readable_by_everyone(self, text_message: TextMessage) -> bool:
+        return not (text_message.sender.encryption_on or text_message.recipient.encryption_on)
+
+    def is_owned_by_search_owner(self, text_message: TextMessage) -> bool:
+        return self.search_owner is not None and (text_message.sender == self.search_owner or
+                                                  text_message.recipient == self.search_owner)
 
-    def restore_from_backup(self):
-        if os.stat(BACKUP_FILE).st_size < 50:
+    def index_text_message(self, dispatch_display: DispatchDisplay, text_message: TextMessage) -> None:
+        document_id = self.next_document_id
+        self.next_document_id += 1
+        self.search_documents[document_id] = (dispatch_display, text_message)
+        self.documents_of_dispatch_display.setdefault(id(dispatch_display), []).append(document_id)
+
+        if self.is_text_readable_by_everyone(text_message):
+            self.search_index.add(document_id, f"{text_message.subject} {text_message.text}")
             return
-        with open(BACKUP_FILE, "rb") as backup:
-            dispatches = pickle.load(backup)
-        for dispatch in dispatches:
-            if not dispatch[0].text_messages:
-                continue
-            dispatch_display = self.create_dispatch_display(dispatch[0], dispatch[1])
-            self.add_dispatch_display(dispatch_display)
+        self.search_index.add(document_id, text_message.subject)
+        if self.is_owned_by_search_owner(text_message):
+            self.private_search_index.add(document_id, f"{text_message.subject} {text_message.plain_text}")
+
+    def index_dispatch_display(self, dispatch_display: DispatchDisplay) -> None:
+        for text_message in dispatch_display.dispatch.text_messages:
+            self.index_text_message(dispatch_display, text_message)
+
+    def unindex_dispatch_display(self, dispatch_display: DispatchDisplay) -> None:
+        for document_id in self.documents_of_dispatch_display.pop(id(dispatch_display), []):
+            self.search_index.remove(document_id)
+            if self.private_search_index is not None:
+                self.private_search_index.remove(document_id)
+            del self.search_documents[document_id]
+
+    def on_dispatch_display_text_message_added(self, message: DispatchDisplay.TextMessageAdded) -> None:
+        self.index_text_message(message.dispatch_display, message.text_message)
+
+    def open_private_search_index(self, owner: User) -> None:
+        self.search_owner = owner
+        self.private_search_index = SearchIndex()
+        for document_id, (_, text_message) in self.search_documents.items():
+            if not self.is_text_readable_by_everyone(text_message) and self.is_owned_by_search_owner(text_message):
+                self.private_search_index.add(document_id, f"{text_message.subject} {text_message.plain_text}")
+
+    def close_private_search_index(self) -> None:
+        self.search_owner = None
+        self.private_search_index = None
+
+    def search(self, query: str) -> list[tuple[DispatchDisplay, TextMessage]]:
+        document_ids = set(self.search_index.search(query))
+        if self.private_search_index is not None:
+            document_ids.update(self.private_search_index.search(query))
+        return [self.search_documents[document_id] for document_id in sorted(document_ids, reverse=True)]
+
+    def show_search_result(self, dispatch_display: DispatchDisplay, text_message: TextMessage) -> None:
+        self.query(".search_result").remove_class("search_result")
+        for text_message_display in dispatch_display.query(TextMessageDisplay):
+            if text_message_display.text_message is text_message:
+                text_message_display.add_class("search_result")
+                self.scroll_to_widget(text_message_display)
+                return
+
+    def backup(self):
+        save_backup([(dispatch_display.dispatch, dispatch_display.is_received)
+                     for dispatch_display in self.dispatch_displays])
+
+    def restore_from_backup(self) -> Dispatch:
+        history, open_dispatch = load_backup()
+        for dispatch, is_received in history:
+            self.add_dispatch_display(self.create_dispatch_display(dispatch, is_received))
+        # the messages of the open dispatch, queued ones among them, still wait to be sent
+        return open_dispatch
 
     def compose(self) -> ComposeResult:
         for dispatch_display in self.dispatch_displays:
@@ -190,11 +304,14 @@ class TextMessageInput(Widget):
     class TextMessageSubmitted(Message):
         """When the message is submitted"""
 
-        def __init__(self, sender: User, recipient: User, subject: str, text: str) -> None:
+        def __init__(self, sender: User, recipient: User, subject: str, text: str, priority: int = 0,
+                     attachment_path: str | None = None) -> None:
             self.sender = sender
             self.recipient = recipient
             self.subject = subject
             self.text = text
+            self.priority = priority
+            self.attachment_path = attachment_path
             super().__init__()
 
     def on_mount(self) -> None:
@@ -210,8 +327,20 @@ class TextMessageInput(Widget):
             self.notify(title="Empty text", message="The text of the message cannot be empty. Add some text.",
                         severity="error", timeout=5.0)
             return False
+        attachment_path = self.get_attachment_path()
+        if attachment_path is not None and not os.path.isfile(attachment_path):
+            self.notify(title="Invalid attachment", message="The file to attach does not exist. Check the path.",
+                        severity="error", timeout=5.0)
+            return False
+        if attachment_path is not None and os.path.getsize(attachment_path) == 0:
+            self.notify(title="Invalid attachment", message="The file to attach is empty.",
+                        severity="error", timeout=5.0)
+            return False
         return True
 
+    def get_attachment_path(self) -> str | None:
+        return self.query_one("#attachment").value.strip() or None
+
     def send_button_pressed(self) -> None:
         if not self.validate_text_message():
             return
@@ -219,7 +348,8 @@ class TextMessageInput(Widget):
         subject = self.query_one("#subject").value
         text = self.query_one("#text").value
 
-        self.post_message(self.TextMessageSubmitted(None, None, subject, text))
+        self.post_message(self.TextMessageSubmitted(None, None, subject, text,
+                                                    attachment_path=self.get_attachment_path()))
 
     def cancel_button_pressed(self) -> None:
         self.remove()
@@ -235,7 +365,7 @@ class TextMessageInput(Widget):
     def on_input_submitted(self, message: Input.Submitted) -> None:
         if message.input.id == "subject":
             self.query_one("#text").focus()
-        if message.input.id == "text":
+        if message.input.id in ("text", "attachment"):
             self.send_button_pressed()
 
     def compose(self) -> ComposeResult:
@@ -243,6 +373,68 @@ class TextMessageInput(Widget):
         yield Input(id="subject", placeholder="Specify message recipient or subject", max_length=SUBJECT_MAX_LENGTH)
         yield Label(f"Text (max length {MESSAGE_MAX_LENGTH}):")
         yield Input(id="text", placeholder="Write message text", max_length=MESSAGE_MAX_LENGTH)
+        yield Label("Attachment (optional):")
+        yield Input(id="attachment", placeholder="Path of a file sent in chunks over the following dispatches")
         with Horizontal():
             yield Button(label="Send", variant="success", id="send")
             yield Button(label="Cancel", variant="error", id="cancel")
+
+
+class SearchBar(Widget):
+    """Search in subjects and texts of the messages"""
+    BINDINGS = [("escape", "close", "Close search")]
+
+    COMPONENT_CLASSES = {"search_bar"}
+
+    result_index = 0
+
+    class ResultRequested(Message):
+        """Search result should be shown"""
+
+        def __init__(self, query: str, result_index: int) -> None:
+            self.query = query
+            self.result_index = result_index
+            super().__init__()
+
+    def on_mount(self) -> None:
+        self.query_one("#search_query").focus()
+
+    def show_result_status(self, result_index: int, result_count: int) -> None:
+        if result_count == 0:
+            self.query_one("#search_status").update("No results")
+        else:
+            self.query_one("#search_status").update(f"Result {result_index + 1} of {result_count}")
+
+    def request_result(self) -> None:
+        query = self.query_one("#search_query").value
+        if query.strip():
+            self.post_message(self.ResultRequested(query, self.result_index))
+        else:
+            self.query_one("#search_status").update("")
+
+    def on_input_changed(self, message: Input.Changed) -> None:
+        self.result_index = 0
+        self.request_result()
+
+    def on_input_submitted(self, message: Input.Submitted) -> None:
+        self.result_index += 1
+        self.request_result()
+
+    def action_close(self) -> None:
+        self.remove()
+
+    def on_button_pressed(self, event: Button.Pressed) -> None:
+        if event.button.id == "next":
+            self.result_index += 1
+            self.request_result()
+        elif event.button.id == "close":
+            self.remove()
+
+        event.prevent_default()
+
+    def compose(self) -> ComposeResult:
+        with Horizontal():
+            yield Input(id="search_query", placeholder="Search in subjects and texts")
+            yield Static(id="search_status", classes="search_status")
+            yield Button(label="Next", variant="primary", id="next")
+            yield Button(label="Close", variant="error", id="close")